@@ -1,7 +1,9 @@
 import streamlit as st
 from utils import load_css, navigation 
+from metrics import METRICS
 
 st.set_page_config(page_title="Health Nexus", page_icon="🧬", layout="wide")
+METRICS.begin_run("Home")
 load_css()
 navigation() # <--- Now this will work because we imported it above
 
@@ -1,15 +1,17 @@
 import streamlit as st
-import plotly.graph_objects as go
-from utils import load_css, navigation, get_live_model, predict_live
+import pandas as pd
+from utils import load_css, navigation, get_live_model, predict_profiles, load_sensitivity, prediction_cache, MODEL_CHOICES, INTERVAL_LEVEL
+from metrics import METRICS, span
 
 st.set_page_config(page_title="Prediction", page_icon="🔮", layout="wide")
+METRICS.begin_run("Individual_Prediction")
 load_css()
 navigation()
 
 # --- HEADER ---
 st.title("🔮 INDIVIDUAL FORECAST")
 st.markdown("### *Multi-Algorithm Intelligence*")
-st.markdown("Select from **11 different AI models**. The system will train your selection on the live dataset instantly.")
+st.markdown(f"Select from **{len(MODEL_CHOICES)} different AI models**. The system will train your selection on the live dataset instantly.")
 st.markdown("---")
 
 # --- CONTROL DECK ---
@@ -26,29 +28,14 @@ with st.container():
 
     with c2:
         st.markdown("**⚖️ BIOMETRICS**")
-        bmi = st.slider("BMI Score", 15.0, 50.0, 28.5)
+        bmi = st.slider("BMI Score", 15.0, 50.0, 28.5, step=0.1)
         smoker = st.toggle("Active Smoker", value=False)
         dependents = st.number_input("Dependents / Children", 0, 5, 0)
 
     with c3:
         st.markdown("**🧠 INTELLIGENCE CORE**")
-        # THE FULL 11-MODEL LIST
-        model_choice = st.selectbox(
-            "Select Algorithm", 
-            [
-                "Random Forest", 
-                "Gradient Boosting", 
-                "AdaBoost", 
-                "Extra Trees", 
-                "Decision Tree",
-                "Linear Regression", 
-                "Ridge Regression", 
-                "Lasso Regression", 
-                "ElasticNet",
-                "K-Nearest Neighbors",
-                "Support Vector Machine (SVR)"
-            ]
-        )
+        # THE FULL MODEL CATALOG
+        model_choice = st.selectbox("Select Algorithm", MODEL_CHOICES)
         
         # Train on demand
         model, features = get_live_model(model_choice)
@@ -66,15 +53,20 @@ if model:
         'age': age, 'bmi': bmi, 'sex': sex, 
         'smoker': smoker, 'region': region, 'dependents': dependents
     }
-    cost = predict_live(model, features, inputs)
-    
     # 2. Optimization
     opt_inputs = inputs.copy()
     opt_inputs['bmi'] = 22.0
     opt_inputs['smoker'] = False
-    opt_cost = predict_live(model, features, opt_inputs)
+    
+    # Both profiles in one call; repeat profiles come from the shared prediction cache
+    (cost, low, high), (opt_cost, _, _) = predict_profiles(model_choice, model, features, [inputs, opt_inputs])
     
     gap = cost - opt_cost
+    # Material once optimal health falls below this profile's interval (flat $1,000 for uncalibrated models)
+    calibrated = pd.notna(low)
+    material = opt_cost < low if calibrated else gap > 1000
+    # (&#36;: two bare dollar signs in one line would render as LaTeX)
+    band = f"{INTERVAL_LEVEL:.0%} range: &#36;{low:,.0f} – &#36;{high:,.0f}" if calibrated else "No calibrated range for this model"
     
     # --- VISUALS ---
     c_res1, c_res2 = st.columns([1, 1.5])
@@ -84,11 +76,12 @@ if model:
         st.markdown(f"""
         <div style="background-color: #111; padding: 20px; border-radius: 10px; border-left: 5px solid #00F0FF; box-shadow: 0 0 20px rgba(0, 240, 255, 0.2);">
             <h1 style='font-size: 56px; color: #00F0FF; margin: 0;'>${cost:,.0f}</h1>
+            <p style='margin: 0; color: #00F0FF;'>{band}</p>
             <p style='margin: 0; color: #888;'>Algorithm: {model_choice}</p>
         </div>
         """, unsafe_allow_html=True)
         
-        if gap > 1000:
+        if material:
             st.markdown("<br>", unsafe_allow_html=True)
             st.warning(f"⚠️ **RISK ANALYSIS:**\n\nYour profile suggests a **${gap:,.0f} premium** compared to optimal health.")
         else:
@@ -96,31 +89,66 @@ if model:
             st.success("✅ **LOW RISK PROFILE:**\n\nTracking with healthy baseline.")
 
     with c_res2:
-        # Gauge Chart
-        fig = go.Figure(go.Indicator(
-            mode = "gauge+delta", value = cost,
-            domain = {'x': [0, 1], 'y': [0, 1]},
-            title = {'text': "Financial Risk Meter", 'font': {'size': 24, 'color': "white"}},
-            delta = {'reference': opt_cost, 'increasing': {'color': "#FF0055"}, 'decreasing': {'color': "#00FFaa"}},
-            gauge = {
-                'axis': {'range': [0, 65000], 'tickcolor': "white"},
-                'bar': {'color': "#00F0FF"},
-                'bgcolor': "rgba(0,0,0,0)",
-                'borderwidth': 2,
-                'bordercolor': "#333",
-                'steps': [
-                    {'range': [0, 15000], 'color': '#222'},
-                    {'range': [15000, 65000], 'color': '#111'}],
-                'threshold': {'line': {'color': "red", 'width': 4}, 'thickness': 0.75, 'value': 50000}}
-        ))
+        # Gauge Chart (plotly is only imported once there is a forecast to draw)
+        import plotly.graph_objects as go
+        with span('chart'):
+            fig = go.Figure(go.Indicator(
+                mode = "gauge+delta", value = cost,
+                domain = {'x': [0, 1], 'y': [0, 1]},
+                title = {'text': "Financial Risk Meter", 'font': {'size': 24, 'color': "white"}},
+                delta = {'reference': opt_cost, 'increasing': {'color': "#FF0055"}, 'decreasing': {'color': "#00FFaa"}},
+                gauge = {
+                    'axis': {'range': [0, 65000], 'tickcolor': "white"},
+                    'bar': {'color': "#00F0FF"},
+                    'bgcolor': "rgba(0,0,0,0)",
+                    'borderwidth': 2,
+                    'bordercolor': "#333",
+                    'steps': [
+                        {'range': [0, 15000], 'color': '#222'},
+                        {'range': [15000, 65000], 'color': '#111'}] + ([{'range': [low, high], 'color': '#0B3D47'}] if calibrated else []),
+                    'threshold': {'line': {'color': "red", 'width': 4}, 'thickness': 0.75, 'value': 50000}}
+            ))
         
-        fig.update_layout(
-            height=300, 
-            margin=dict(t=50, b=20, l=40, r=40), 
-            paper_bgcolor='rgba(0,0,0,0)', 
-            font={'color': 'white'}
-        )
-        st.plotly_chart(fig, use_container_width=True)
+            fig.update_layout(
+                height=300, 
+                margin=dict(t=50, b=20, l=40, r=40), 
+                paper_bgcolor='rgba(0,0,0,0)', 
+                font={'color': 'white'}
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+    # --- SENSITIVITY: BMI x smoking x aging x dependents grid, scored in one batched call ---
+    st.markdown("---")
+    st.markdown("#### 📈 SENSITIVITY ANALYSIS")
+    surface = load_sensitivity(model_choice, model, features, inputs)
+    effects = surface.effects()
+
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("+1 BMI point", f"${effects['bmi']:+,.0f}")
+    m2.metric("+1 year of age", f"${effects['age']:+,.0f}")
+    m3.metric("+1 dependent", f"${effects['dependents']:+,.0f}")
+    m4.metric("Smoking", f"${effects['smoker']:+,.0f}")
+
+    import plotly.express as px
+    s1, s2 = st.columns(2)
+    with s1:
+        with span('chart'):
+            curves = pd.DataFrame({'Non-smoker': surface.curve('bmi', smoker=False), 'Smoker': surface.curve('bmi', smoker=True)})
+            fig = px.line(curves, labels={'value': 'Annual cost ($)', 'bmi': 'BMI', 'variable': ''}, title="Cost vs. BMI",
+                          color_discrete_sequence=['#00FFaa', '#FF0055'])
+            fig.add_vline(x=bmi, line_dash="dash", line_color="white")
+            fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'})
+            st.plotly_chart(fig, use_container_width=True)
+    with s2:
+        with span('chart'):
+            heat = surface.grid('bmi', 'age')
+            fig = px.imshow(heat, aspect='auto', origin='lower', color_continuous_scale='Inferno',
+                            labels={'x': 'BMI', 'y': 'Age', 'color': 'Cost ($)'}, title="Next 10 years: Age x BMI")
+            fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'})
+            st.plotly_chart(fig, use_container_width=True)
+
+    stats = prediction_cache().stats()
+    st.caption(f"Prediction cache: {stats['hit_rate']:.0%} hit rate · {stats['hits']:,} hits / {stats['misses']:,} misses · {stats['entries']:,} profiles cached")
 
 else:
     st.error("⚠️ Model could not be trained. Check CSV.")
\ No newline at end of file
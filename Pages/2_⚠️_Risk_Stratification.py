@@ -1,24 +1,24 @@
 import streamlit as st
-import plotly.express as px
-from utils import load_css, load_dataset, navigation
+from utils import load_css, load_chart_sample, load_aggregates, navigation
+from metrics import METRICS, span
 
 st.set_page_config(page_title="Risk Stratification", page_icon="⚠️", layout="wide")
+METRICS.begin_run("Risk_Stratification")
 load_css()
 navigation()
-df = load_dataset()
+cube = load_aggregates()
 
 st.title("⚠️ RISK STRATIFICATION")
 st.markdown("### *Population Segmentation Analysis*")
 st.markdown("---")
 
-# Metrics
+# Metrics (pre-aggregated)
 c1, c2, c3 = st.columns(3)
-high_risk = df[df['risk_category'] == 'High']
-med_risk = df[df['risk_category'] == 'Medium']
+n_high = cube.count(risk='High')
 
-c1.metric("High Risk Patients", f"{len(high_risk):,}", f"{len(high_risk)/len(df):.1%} of Total")
-c2.metric("Avg Cost (High Risk)", f"${high_risk['annual_medical_cost'].mean():,.0f}")
-c3.metric("Avg Cost (Low Risk)", f"${df[df['risk_category']=='Low']['annual_medical_cost'].mean():,.0f}")
+c1.metric("High Risk Patients", f"{n_high:,}", f"{n_high/max(cube.count(), 1):.1%} of Total")
+c2.metric("Avg Cost (High Risk)", f"${cube.mean('cost', risk='High'):,.0f}")
+c3.metric("Avg Cost (Low Risk)", f"${cube.mean('cost', risk='Low'):,.0f}")
 
 st.markdown("---")
 
@@ -26,23 +26,28 @@ c1, c2 = st.columns([1.5, 1])
 
 with c1:
     st.subheader("🧬 Risk vs. Cost Distribution")
-    # Interactive Scatter
-    fig = px.scatter(
-        df.sample(2000), x="age", y="annual_medical_cost", 
-        color="risk_category", size="bmi",
-        color_discrete_map={'High': '#FF0055', 'Medium': '#FFD700', 'Low': '#00FFaa'},
-        title="Cost Drivers: Age, BMI (Size), and Risk Level"
-    )
-    fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'})
-    st.plotly_chart(fig, use_container_width=True)
+    # Interactive Scatter (plotly loads with the first chart, after the metrics are on screen)
+    import plotly.express as px
+    # Stratified, seeded sample from the cube: stable across reruns, same size at any population
+    with span('chart'):
+        fig = px.scatter(
+            load_chart_sample(), x="age", y="annual_medical_cost", 
+            color="risk_category", size="bmi", render_mode="webgl",
+            color_discrete_map={'High': '#FF0055', 'Medium': '#FFD700', 'Low': '#00FFaa'},
+            title="Cost Drivers: Age, BMI (Size), and Risk Level"
+        )
+        fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'})
+        st.plotly_chart(fig, use_container_width=True)
 
 with c2:
     st.subheader("📊 Segmentation Volume")
-    fig2 = px.pie(
-        df, names='risk_category', values='annual_medical_cost',
-        color='risk_category',
-        color_discrete_map={'High': '#FF0055', 'Medium': '#FFD700', 'Low': '#00FFaa'},
-        hole=0.4
-    )
-    fig2.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'})
-    st.plotly_chart(fig2, use_container_width=True)
\ No newline at end of file
+    with span('chart'):
+        seg = cube.by_risk('cost').rename_axis('risk_category').reset_index(name='annual_medical_cost')
+        fig2 = px.pie(
+            seg, names='risk_category', values='annual_medical_cost',
+            color='risk_category',
+            color_discrete_map={'High': '#FF0055', 'Medium': '#FFD700', 'Low': '#00FFaa'},
+            hole=0.4
+        )
+        fig2.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'})
+        st.plotly_chart(fig2, use_container_width=True)
\ No newline at end of file
@@ -1,41 +1,47 @@
 import streamlit as st
-import plotly.express as px
-from utils import load_css, load_dataset, navigation
+from utils import load_css, load_aggregates, navigation
+from metrics import METRICS, span
 
 st.set_page_config(page_title="Utilization", page_icon="🏥", layout="wide")
+METRICS.begin_run("Utilization_Analytics")
 load_css()
 navigation()
-df = load_dataset()
+cube = load_aggregates()
+proc_cols = cube.proc_cols
 
 st.title("🏥 UTILIZATION ANALYTICS")
 st.markdown("### *Healthcare Consumption Patterns*")
 st.markdown("---")
 
 # Filters
-region = st.selectbox("Filter by Region", ['All'] + list(df['region'].unique()))
-dff = df if region == 'All' else df[df['region'] == region]
+region = st.selectbox("Filter by Region", ['All'] + cube.regions)
 
 col1, col2 = st.columns(2)
 
+import plotly.express as px  # Loaded with the first chart, after the metrics are on screen
+
 with col1:
     st.subheader("📡 Procedure Frequency")
-    # Check for procedure columns
-    proc_cols = [c for c in df.columns if 'proc_' in c]
     if proc_cols:
-        proc_data = dff[proc_cols].mean().reset_index()
-        proc_data.columns = ['Procedure', 'Avg Count']
-        fig = px.bar(proc_data, x='Avg Count', y='Procedure', orientation='h', color='Avg Count', color_continuous_scale='Bluered')
-        fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'})
-        st.plotly_chart(fig, use_container_width=True)
+        with span('chart'):
+            proc_data = cube.proc_means(region).reset_index()
+            proc_data.columns = ['Procedure', 'Avg Count']
+            fig = px.bar(proc_data, x='Avg Count', y='Procedure', orientation='h', color='Avg Count', color_continuous_scale='Bluered')
+            fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'})
+            st.plotly_chart(fig, use_container_width=True)
     else:
         st.warning("No procedure data found in CSV.")
 
 with col2:
     st.subheader("💊 Visits vs. Medication")
-    fig2 = px.density_heatmap(
-        dff, x="visits_last_year", y="medication_count",
-        color_continuous_scale="Viridis",
-        title="Heatmap: Doctor Visits vs Meds"
-    )
-    fig2.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'})
-    st.plotly_chart(fig2, use_container_width=True)
\ No newline at end of file
+    # Pre-binned counts: ships one small grid instead of every row
+    with span('chart'):
+        visits, meds, counts = cube.heatmap(region)
+        fig2 = px.imshow(
+            counts, x=visits, y=meds, origin='lower', aspect='auto',
+            labels={'x': 'visits_last_year', 'y': 'medication_count', 'color': 'count'},
+            color_continuous_scale="Viridis",
+            title="Heatmap: Doctor Visits vs Meds"
+        )
+        fig2.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'})
+        st.plotly_chart(fig2, use_container_width=True)
\ No newline at end of file
@@ -1,36 +1,39 @@
 import streamlit as st
-import plotly.express as px
-from utils import load_css, load_dataset, navigation
+from utils import load_css, load_chart_sample, load_aggregates, navigation
+from metrics import METRICS, span
 
 st.set_page_config(page_title="Economics", page_icon="💸", layout="wide")
+METRICS.begin_run("Economic_Burden")
 load_css()
 navigation()
-df = load_dataset()
+cube = load_aggregates()
 
 st.title("💸 ECONOMIC BURDEN")
 st.markdown("### *Affordability & Premium Stress*")
 
-# Logic
-df['burden_percent'] = (df['annual_medical_cost'] / df['income']) * 100
-avg_burden = df['burden_percent'].mean()
+# Logic (population figures from the cube)
+avg_burden = cube.mean('burden')
 
 c1, c2 = st.columns(2)
 c1.metric("Avg Burden", f"{avg_burden:.1f}%", "of Annual Income")
-c2.metric("Median Income", f"${df['income'].median():,.0f}")
+c2.metric("Median Income", f"${cube.quantile('income', 0.5):,.0f}")
 
 st.markdown("---")
 st.subheader("📉 The Affordability Gap")
 st.caption("Patients above the dashed line spend >10% of income on health.")
 
-fig = px.scatter(
-    df.sample(2000), x="income", y="burden_percent", 
-    color="risk_category",
-    color_discrete_map={'High': '#FF0055', 'Medium': '#FFD700', 'Low': '#00FFaa'},
-    log_x=True
-)
-fig.add_hline(y=10, line_dash="dash", line_color="white")
-fig.update_layout(
-    paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'},
-    xaxis_title="Income (Log Scale)", yaxis_title="% Income Spent on Health"
-)
-st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
+import plotly.express as px  # Loaded with the first chart, after the metrics are on screen
+with span('chart'):
+    sample = load_chart_sample()  # Stratified, seeded: the same points on every rerun
+    fig = px.scatter(
+        sample.assign(burden_percent=sample['annual_medical_cost'] / sample['income'] * 100), x="income", y="burden_percent", 
+        color="risk_category", render_mode="webgl",
+        color_discrete_map={'High': '#FF0055', 'Medium': '#FFD700', 'Low': '#00FFaa'},
+        log_x=True
+    )
+    fig.add_hline(y=10, line_dash="dash", line_color="white")
+    fig.update_layout(
+        paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'},
+        xaxis_title="Income (Log Scale)", yaxis_title="% Income Spent on Health"
+    )
+    st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
@@ -1,39 +1,27 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-from utils import load_css, navigation, get_live_model
+from utils import load_css, navigation, get_live_model, load_leaderboard, load_aggregates, load_attributions, MODEL_CHOICES
+from metrics import METRICS, span
 
 st.set_page_config(page_title="AI Insights", page_icon="🧠", layout="wide")
+METRICS.begin_run("Model_Insights")
 load_css()
 navigation()
 
 st.title("🧠 INTELLIGENCE CORE")
 st.markdown("### *Algorithm Transparency & Forensics*")
-st.markdown("Select any of the **11 Models** below to deconstruct its decision-making process.")
+st.markdown(f"Select any of the **{len(MODEL_CHOICES)} Models** below to deconstruct its decision-making process.")
 st.markdown("---")
 
-# 1. GET THE LIVE MODEL (Updated with ALL 11 Options)
-model_type = st.selectbox(
-    "Select Model to Inspect", 
-    [
-        "Random Forest", 
-        "Gradient Boosting", 
-        "AdaBoost", 
-        "Extra Trees", 
-        "Decision Tree",
-        "Linear Regression", 
-        "Ridge Regression", 
-        "Lasso Regression", 
-        "ElasticNet",
-        "K-Nearest Neighbors",
-        "Support Vector Machine (SVR)"
-    ]
-)
+# 1. GET THE LIVE MODEL (Full catalog)
+model_type = st.selectbox("Select Model to Inspect", MODEL_CHOICES)
 
 # Train the model on the fly to get insights
 model, feature_names = get_live_model(model_type)
 
 if model:
+    kind = type(model).__name__
+    library = {'xgboost': 'XGBoost', 'lightgbm': 'LightGBM'}.get(type(model).__module__.split('.')[0], 'Scikit-Learn')
     c1, c2 = st.columns([2, 1])
     
     with c1:
@@ -41,31 +29,39 @@ if model:
         
         # A. TREE-BASED MODELS (Feature Importance)
         if hasattr(model, 'feature_importances_'):
-            imp = model.feature_importances_
-            df_imp = pd.DataFrame({'Feature': feature_names, 'Importance': imp}).sort_values('Importance', ascending=True)
+            import plotly.express as px
+            with span('chart'):
+                imp = model.feature_importances_
+                df_imp = pd.DataFrame({'Feature': feature_names, 'Importance': imp}).sort_values('Importance', ascending=True)
             
-            fig = px.bar(
-                df_imp, x='Importance', y='Feature', orientation='h',
-                color='Importance', color_continuous_scale='Tealgrn',
-                title=f"What matters most to {model_type}?"
-            )
-            fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'})
-            st.plotly_chart(fig, use_container_width=True)
+                fig = px.bar(
+                    df_imp, x='Importance', y='Feature', orientation='h',
+                    color='Importance', color_continuous_scale='Tealgrn',
+                    title=f"What matters most to {model_type}?"
+                )
+                fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'})
+                st.plotly_chart(fig, use_container_width=True)
             
         # B. LINEAR MODELS (Coefficients)
         elif hasattr(model, 'coef_'):
-            imp = model.coef_
-            df_imp = pd.DataFrame({'Feature': feature_names, 'Coefficient': imp}).sort_values('Coefficient', ascending=True)
+            import plotly.express as px
+            with span('chart'):
+                imp = model.coef_
+                df_imp = pd.DataFrame({'Feature': feature_names, 'Coefficient': imp}).sort_values('Coefficient', ascending=True)
             
-            fig = px.bar(
-                df_imp, x='Coefficient', y='Feature', orientation='h',
-                color='Coefficient', color_continuous_scale='Balance',
-                title=f"Weight Impact (Positive vs Negative)"
-            )
-            fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'})
-            st.plotly_chart(fig, use_container_width=True)
+                fig = px.bar(
+                    df_imp, x='Coefficient', y='Feature', orientation='h',
+                    color='Coefficient', color_continuous_scale='Balance',
+                    title=f"Weight Impact (Positive vs Negative)"
+                )
+                fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'})
+                st.plotly_chart(fig, use_container_width=True)
             
-        # C. BLACK BOX MODELS (KNN, SVR)
+        # C. HISTOGRAM BOOSTING (a tree ensemble that keeps no split importances)
+        elif kind == 'HistGradientBoostingRegressor':
+            st.info(f"**{model_type}** is a tree ensemble grown on binned features. It keeps no split importances: its drivers are the exact TreeSHAP attributions below.")
+
+        # D. BLACK BOX MODELS (KNN, SVR)
         else:
             st.warning(f"⚠️ **Black Box Algorithm Detected**")
             st.markdown(f"""
@@ -74,24 +70,84 @@ if model:
             It does not offer a simple "Feature Importance" chart because every data point influences every other data point dynamically.
             """)
             
-            st.info("💡 **Tip:** To see clear drivers, switch to 'Random Forest' or 'Linear Regression'.")
+            st.info("💡 **Tip:** Its drivers are estimated below by sampling feature orderings (Shapley values).")
 
     with c2:
         st.subheader("📝 Technical Specs")
+        n_rows, n_total = getattr(model, 'training_rows', None), load_aggregates().count()
+        rows_used = "n/a" if n_rows is None else f"{n_rows:,} of {n_total:,} rows" if n_rows < n_total else f"Full dataset ({n_rows:,} rows)"
+        if getattr(model, 'update_rows', 0): rows_used += f" + {model.update_rows:,} appended rows (added stages only)"
         st.markdown(f"""
         <div style="background-color: #111; padding: 20px; border-radius: 10px; border: 1px solid #333;">
             <p><b>Algorithm:</b> <span style="color: #00F0FF">{model_type}</span></p>
             <p><b>Input Features:</b> {len(feature_names)}</p>
-            <p><b>Training Data:</b> Live Sample (10k rows)</p>
-            <p><b>Library:</b> Scikit-Learn</p>
+            <p><b>Training Data:</b> {rows_used}</p>
+            <p><b>Library:</b> {library}</p>
         </div>
         """, unsafe_allow_html=True)
         
         st.markdown("### 💡 Analyst Note")
-        if "Linear" in model_type or "Ridge" in model_type:
+        if hasattr(model, 'coef_'):
             st.caption("Linear models show **Direction**: Positive bars increase cost, Negative bars decrease cost.")
-        elif "Tree" in model_type or "Forest" in model_type or "Boost" in model_type:
-            st.caption("Tree models show **Importance**: Which variable was split the most often? (Direction is not shown).")
+        elif hasattr(model, 'feature_importances_'):
+            measure = {'XGBoost': "the average gain of its splits", 'LightGBM': "how many splits use it"}.get(library, "the error reduction of its splits")
+            st.caption(f"Tree models show **Importance**: {measure} (Direction is not shown).")
+        elif kind == 'HistGradientBoostingRegressor':
+            st.caption("Use the Shapley section: it shows each variable's **Importance** and, per member, its **Direction**.")
+
+    # E. SHAPLEY ATTRIBUTIONS (computed once per model version, then served from cache)
+    st.markdown("---")
+    st.subheader("🔍 Shapley Attributions")
+    attr = load_attributions(model_type, model, feature_names)
+    if attr is not None:
+        import plotly.express as px
+        from explain import METHODS
+        st.caption(f"{METHODS[attr.method]} · {len(attr.values)} members explained · baseline ${attr.expected:,.0f}")
+        a1, a2 = st.columns(2)
+        with a1:
+            with span('chart'):
+                imp = attr.importance().sort_values()
+                fig = px.bar(
+                    x=imp.values, y=imp.index, orientation='h', color=imp.values, color_continuous_scale='Tealgrn',
+                    labels={'x': 'Mean |impact| on cost ($)', 'y': '', 'color': '$'}, title="Global: average impact per input"
+                )
+                fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'})
+                st.plotly_chart(fig, use_container_width=True)
+        with a2:
+            member = st.slider("Explain member #", 1, len(attr.values), 1) - 1
+            with span('chart'):
+                row = attr.row(member).sort_values()
+                fig = px.bar(
+                    x=row.values, y=row.index, orientation='h', color=row.values > 0,
+                    color_discrete_map={True: '#FF0055', False: '#00FFaa'}, labels={'x': 'Impact on cost ($)', 'y': ''},
+                    title=f"Member #{member + 1}: ${attr.expected:,.0f} baseline → ${attr.prediction[member]:,.0f}"
+                )
+                fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', font={'color': 'white'}, showlegend=False)
+                st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(pd.DataFrame(attr.data[member:member + 1], columns=feature_names), hide_index=True)
+    else:
+        st.info("💡 Attributions need medical_insurance.csv for the reference population.")
+
+    # E. LEADERBOARD (written by `python -m training`)
+    st.markdown("---")
+    st.subheader("🏆 Catalog Leaderboard")
+    board = load_leaderboard()
+    if board is not None:
+        st.dataframe(
+            board[['model', 'cv_r2', 'cv_rmse', 'cv_mae', 'fit_s', 'predict_single_ms', 'predict_batch_us_per_row', 'size_kb', 'rows', 'version']],
+            hide_index=True, use_container_width=True,
+            column_config={
+                'cv_r2': st.column_config.NumberColumn("CV R²", format="%.3f"),
+                'cv_rmse': st.column_config.NumberColumn("CV RMSE", format="$%.0f"),
+                'cv_mae': st.column_config.NumberColumn("CV MAE", format="$%.0f"),
+                'fit_s': st.column_config.NumberColumn("Fit (s)", format="%.2f"),
+                'predict_single_ms': st.column_config.NumberColumn("1-row predict (ms)", format="%.2f"),
+                'predict_batch_us_per_row': st.column_config.NumberColumn("Batch (µs/row)", format="%.1f"),
+                'size_kb': st.column_config.NumberColumn("Size (KB)", format="%.0f"),
+            }
+        )
+    else:
+        st.info("💡 Run `python -m training` to benchmark the whole catalog in parallel.")
 
 else:
     st.error("Engine Offline. Check medical_insurance.csv.")
\ No newline at end of file
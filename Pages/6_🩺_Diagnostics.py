@@ -0,0 +1,86 @@
+import os
+import time
+import streamlit as st
+import pandas as pd
+from utils import load_css, navigation
+from metrics import METRICS, rss_bytes
+
+st.set_page_config(page_title="Diagnostics", page_icon="🩺", layout="wide")
+METRICS.begin_run("Diagnostics")
+load_css()
+navigation()
+
+st.title("🩺 DIAGNOSTICS")
+st.markdown("### *Where the time goes, per step and per page run*")
+st.markdown("---")
+
+# Opt-in: step names and timings are operator detail, not for every visitor
+if os.environ.get('DIAGNOSTICS', '0') != '1':
+    st.info("💡 Diagnostics are off. Start the app with `DIAGNOSTICS=1` to see step timings, cache hit ratios and memory here.")
+    st.stop()
+
+# 1. PROCESS
+rss, cpu = rss_bytes(), os.times()
+runs = METRICS.recent_runs()  # Every run but this one
+c1, c2, c3, c4 = st.columns(4)
+c1.metric("Resident Memory", f"{rss / 2**20:,.0f} MB" if rss is not None else "n/a")
+c2.metric("CPU Time", f"{cpu.user + cpu.system:,.1f} s")
+c3.metric("Uptime", f"{(time.time() - METRICS.started) / 60:,.1f} min")
+c4.metric("Page Runs", f"{sum(v for (m, _), v in list(METRICS.counters.items()) if m == 'page_runs'):,}")
+
+st.markdown("---")
+c1, c2 = st.columns([1.5, 1])
+
+# 2. STEP TIMINGS (every span since the process started)
+with c1:
+    st.subheader("⏱️ Step Timings")
+    steps = pd.DataFrame([{'step': k, 'calls': n, 'total_s': total, 'mean_ms': total / n * 1000, 'max_ms': mx * 1000}
+                          for k, (n, total, mx) in METRICS.step_stats().items()])
+    if len(steps):
+        st.dataframe(
+            steps.sort_values('total_s', ascending=False), hide_index=True, use_container_width=True,
+            column_config={
+                'total_s': st.column_config.NumberColumn("Total (s)", format="%.2f"),
+                'mean_ms': st.column_config.NumberColumn("Mean (ms)", format="%.2f"),
+                'max_ms': st.column_config.NumberColumn("Max (ms)", format="%.1f"),
+            }
+        )
+    else:
+        st.info("💡 No steps recorded yet: open another page first.")
+
+# 3. CACHES (a loader's body only runs on a miss)
+with c2:
+    st.subheader("🗄️ Cache Hit Ratios")
+    caches = pd.DataFrame([{'cache': k, 'requests': n, 'misses': m, 'hit_ratio': r}
+                           for k, (n, m, r) in sorted(METRICS.cache_stats().items())])
+    if len(caches):
+        st.dataframe(caches, hide_index=True, use_container_width=True,
+                     column_config={'hit_ratio': st.column_config.ProgressColumn("Hit ratio", format="%.0f%%", min_value=0, max_value=1)})
+
+# 4. RECENT PAGE RUNS (top-level steps; nested ones in the detail view)
+st.markdown("---")
+st.subheader("🧾 Recent Page Runs")
+if runs:
+    rows = []
+    for r in reversed(runs):
+        top = {}
+        for path, seconds, depth in r['steps']:
+            if depth == 0: top[path] = top.get(path, 0.0) + seconds * 1000
+        rows.append(dict({'page': r['page'], 'at': time.strftime('%H:%M:%S', time.localtime(r['started'])),
+                          'instrumented_ms': sum(top.values())}, **top))
+    st.dataframe(pd.DataFrame(rows).fillna(0).round(1), hide_index=True, use_container_width=True)
+
+    pick = st.selectbox("Run detail", range(len(runs)), format_func=lambda i: f"{runs[-1 - i]['page']} @ {rows[i]['at']}")
+    detail = pd.DataFrame(runs[-1 - pick]['steps'], columns=['step', 'seconds', 'depth'])
+    detail['ms'] = detail.pop('seconds') * 1000
+    st.dataframe(detail.groupby(['step', 'depth'], sort=False)['ms'].agg(['count', 'sum']).round(2).reset_index(), hide_index=True)
+else:
+    st.info("💡 No page runs recorded yet.")
+
+# 5. EXPORT
+st.markdown("---")
+d1, d2 = st.columns(2)
+d1.download_button("⬇️ Prometheus text", METRICS.render(), file_name="metrics.prom", mime="text/plain")
+d2.download_button("⬇️ OpenMetrics", METRICS.render(openmetrics=True), file_name="metrics.om.txt", mime="application/openmetrics-text")
+with st.expander("Raw exposition"):
+    st.code(METRICS.render(), language="text")
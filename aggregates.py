@@ -0,0 +1,281 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from datastore import SOURCE_CSV, CACHE_DIR, RISK_LABELS, HAS_ARROW, read_table, data_version
+
+# ==========================================
+# 1. CUBE LAYOUT
+# ==========================================
+# Every measure is additive (counts / sums / bin counts) so cubes can be merged,
+# and every widget is answered from cells instead of rows. Sums skip non-finite
+# values and each keeps its own count (`<measure>_n`), the denominator of its mean. Scatter charts read a
+# per-cell bottom-k sample (rows with the smallest seeded hash keys), which merges
+# the same way.
+CUBE_VERSION = 3
+COST_BINS = np.concatenate([[0], np.geomspace(50, 100_000, 80), [np.inf]])
+INCOME_BINS = np.concatenate([[0], np.geomspace(100, 10_000_000, 1000), [np.inf]])
+VISITS_MAX, MEDS_MAX = 30, 15  # 2-D bins are integer counts, last bin is "or more"
+SAMPLE_COLS = ['age', 'bmi', 'annual_medical_cost', 'income']
+SAMPLE_PER_CELL = 2000
+SAMPLE_SEED = 'chart-sample-001'  # 16-byte hash key: same rows every run, on every machine
+
+NEEDED = ['region', 'risk_category', 'annual_medical_cost', 'income', 'visits_last_year', 'medication_count', 'age', 'bmi']
+
+
+def _cube_path(source):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(CACHE_DIR, f'{stem}.cube.npz')
+
+
+class Cube:
+    """Pre-aggregated region x risk_category measures.
+
+    Filters are keyword arguments on the dimensions (`region='North'`); None or
+    'All' means no filter on that axis.
+    """
+
+    def __init__(self, regions, risks, proc_cols, arrays, meta=None):
+        self.regions = list(regions)
+        self.risks = list(risks)
+        self.proc_cols = list(proc_cols)
+        self.arrays = arrays
+        self.meta = meta or {}
+
+    # --- building --------------------------------------------------------
+    @classmethod
+    def empty(cls, regions, risks, proc_cols):
+        shape = (len(regions), len(risks))
+        arrays = {
+            'count': np.zeros(shape, dtype=np.int64),
+            'cost_sum': np.zeros(shape),
+            'income_sum': np.zeros(shape),
+            'burden_sum': np.zeros(shape),
+            'proc_sum': np.zeros(shape + (len(proc_cols),)),
+            **{f'{m}_n': np.zeros(shape, dtype=np.int64) for m in ('cost', 'income', 'burden')},
+            'proc_n': np.zeros(shape + (len(proc_cols),), dtype=np.int64),
+            'cost_hist': np.zeros(shape + (len(COST_BINS) - 1,), dtype=np.int64),
+            'income_hist': np.zeros(shape + (len(INCOME_BINS) - 1,), dtype=np.int64),
+            'visits_meds': np.zeros(shape + (VISITS_MAX + 1, MEDS_MAX + 1), dtype=np.int64),
+            'sample_key': np.full(shape + (SAMPLE_PER_CELL,), np.inf),  # Sorted per cell; inf = empty slot
+            **{f'sample_{c}': np.full(shape + (SAMPLE_PER_CELL,), np.nan, dtype=np.float32) for c in SAMPLE_COLS},
+        }
+        return cls(regions, risks, proc_cols, arrays)
+
+    @classmethod
+    def from_frame(cls, df, regions=None, risks=RISK_LABELS, proc_cols=None):
+        if regions is None: regions = sorted(pd.unique(df['region'].dropna().astype(str)))
+        if proc_cols is None: proc_cols = [c for c in df.columns if 'proc_' in c]
+        cube = cls.empty(regions, risks, proc_cols)
+        cube.add(df)
+        return cube
+
+    def _extend_regions(self, values):
+        new = [r for r in pd.unique(values.dropna().astype(str)) if r not in self.regions]
+        if not new: return
+        self.regions += sorted(new)
+        for k, arr in self.arrays.items():
+            pad = [(0, len(new))] + [(0, 0)] * (arr.ndim - 1)
+            fill = np.inf if k == 'sample_key' else np.nan if k.startswith('sample_') else 0
+            self.arrays[k] = np.pad(arr, pad, constant_values=fill)
+
+    def add(self, df):
+        """Fold a batch of rows into the cube (one bincount per measure)."""
+        self._extend_regions(df['region'])
+        r = pd.Index(self.regions).get_indexer(df['region'].astype(str))
+        k = pd.Index(self.risks).get_indexer(df['risk_category'].astype(str))
+        ok = (r >= 0) & (k >= 0)
+        shape = self.arrays['count'].shape
+        n_cells = shape[0] * shape[1]
+        cell = (r * shape[1] + k)[ok]
+
+        def col(name):
+            return df[name].to_numpy(dtype=np.float64)[ok] if name in df.columns else np.zeros(ok.sum())
+
+        def cell_sum(w=None, extra=None, size=None):
+            if extra is None: return np.bincount(cell, weights=w, minlength=n_cells).reshape(shape)
+            flat = np.bincount(cell * size + extra, weights=w, minlength=n_cells * size)
+            return flat.reshape(shape + (size,))
+
+        def counted(valid, extra=None, size=None):
+            return cell_sum(valid.astype(np.float64), extra, size).astype(np.int64)
+
+        def binned(v, edges):
+            # Non-finite values are not binned; out-of-range ones land in the edge bins
+            nb = len(edges) - 1
+            return counted(np.isfinite(v), np.clip(np.searchsorted(edges, v, side='right') - 1, 0, nb - 1), nb)
+
+        cost, income = col('annual_medical_cost'), col('income')
+        # Burden only where the income is a positive number
+        has_burden = np.isfinite(cost) & np.isfinite(income) & (income > 0)
+        burden = np.divide(cost, income, out=np.zeros_like(cost), where=has_burden) * 100
+        self.arrays['count'] += cell_sum().astype(np.int64)
+        for name, v, valid in [('cost', cost, np.isfinite(cost)), ('income', income, np.isfinite(income)),
+                               ('burden', burden, has_burden)]:
+            self.arrays[f'{name}_sum'] += cell_sum(np.where(valid, v, 0))
+            self.arrays[f'{name}_n'] += counted(valid)
+        for j, c in enumerate(self.proc_cols):
+            v = col(c)
+            self.arrays['proc_sum'][..., j] += cell_sum(np.where(np.isfinite(v), v, 0))
+            self.arrays['proc_n'][..., j] += counted(np.isfinite(v))
+        self.arrays['cost_hist'] += binned(cost, COST_BINS)
+        self.arrays['income_hist'] += binned(income, INCOME_BINS)
+        visits, meds = col('visits_last_year'), col('medication_count')
+        v = np.clip(np.nan_to_num(visits), 0, VISITS_MAX).astype(np.int64)
+        m = np.clip(np.nan_to_num(meds), 0, MEDS_MAX).astype(np.int64)
+        size = (VISITS_MAX + 1) * (MEDS_MAX + 1)
+        grid = counted(np.isfinite(visits) & np.isfinite(meds), v * (MEDS_MAX + 1) + m, size)
+        self.arrays['visits_meds'] += grid.reshape(self.arrays['visits_meds'].shape)
+        self._add_sample(df, cell, ok, col)
+        return self
+
+    def _add_sample(self, df, cell, ok, col):
+        # Keep the SAMPLE_PER_CELL rows with the smallest content-hash keys per cell, so
+        # the sample is seeded, independent of row order and unchanged by reruns
+        cols = [c for c in SAMPLE_COLS if c in df.columns]
+        if not cols or not len(cell): return
+        key = pd.util.hash_pandas_object(df[cols], index=False, hash_key=SAMPLE_SEED).to_numpy()[ok] / 2.0 ** 64
+        shape = self.arrays['sample_key'].shape
+        keys = self.arrays['sample_key'].reshape(-1, SAMPLE_PER_CELL)
+        vals = {c: self.arrays[f'sample_{c}'].reshape(-1, SAMPLE_PER_CELL) for c in SAMPLE_COLS}
+        new = {c: col(c) for c in SAMPLE_COLS}
+        for i in np.unique(cell):
+            rows = np.flatnonzero(cell == i)
+            merged = np.concatenate([keys[i], key[rows]])
+            keep = np.argsort(merged, kind='stable')[:SAMPLE_PER_CELL]
+            keys[i] = merged[keep]
+            for c in SAMPLE_COLS: vals[c][i] = np.concatenate([vals[c][i], new[c][rows]])[keep]
+        self.arrays['sample_key'] = keys.reshape(shape)
+        for c in SAMPLE_COLS: self.arrays[f'sample_{c}'] = vals[c].reshape(shape)
+
+    # --- persistence -----------------------------------------------------
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        meta = dict(self.meta, regions=self.regions, risks=self.risks, proc_cols=self.proc_cols, version=CUBE_VERSION)
+        tmp = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp, __meta__=np.array(json.dumps(meta)), **self.arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            meta = json.loads(str(z['__meta__']))
+            arrays = {k: z[k] for k in z.files if k != '__meta__'}
+        return cls(meta['regions'], meta['risks'], meta['proc_cols'], arrays, meta)
+
+    # --- queries ---------------------------------------------------------
+    def _index(self, labels, value):
+        if value is None or value == 'All': return slice(None)
+        return [labels.index(value)] if value in labels else []
+
+    def _cells(self, name, region=None, risk=None):
+        return self.arrays[name][self._index(self.regions, region)][:, self._index(self.risks, risk)]
+
+    def count(self, region=None, risk=None):
+        return int(self._cells('count', region, risk).sum())
+
+    def total(self, measure, region=None, risk=None):
+        return float(self._cells(f'{measure}_sum', region, risk).sum())
+
+    def mean(self, measure, region=None, risk=None):
+        n = int(self._cells(f'{measure}_n', region, risk).sum())
+        return self.total(measure, region, risk) / n if n else float('nan')
+
+    def by_risk(self, measure, region=None):
+        """Series indexed by risk_category: row counts ('count') or measure sums."""
+        name = 'count' if measure == 'count' else f'{measure}_sum'
+        return pd.Series(self._cells(name, region).sum(axis=0), index=self.risks)
+
+    def proc_means(self, region=None):
+        n = self._cells('proc_n', region).sum(axis=(0, 1))
+        sums = self._cells('proc_sum', region).sum(axis=(0, 1))
+        with np.errstate(divide='ignore', invalid='ignore'): return pd.Series(np.where(n > 0, sums / n, np.nan), index=self.proc_cols)
+
+    def quantile(self, measure, q, region=None, risk=None):
+        # Linear interpolation inside the histogram bin holding the q-th row
+        edges = COST_BINS if measure == 'cost' else INCOME_BINS
+        hist = self._cells(f'{measure}_hist', region, risk).sum(axis=(0, 1))
+        cum = np.cumsum(hist)
+        if not cum[-1]: return float('nan')
+        target = q * cum[-1]
+        i = int(np.searchsorted(cum, target))
+        lo, hi = edges[i], edges[i + 1] if np.isfinite(edges[i + 1]) else edges[i]
+        prev = cum[i - 1] if i else 0
+        return float(lo + (hi - lo) * (target - prev) / max(hist[i], 1))
+
+    def heatmap(self, region=None, risk=None):
+        """(visits axis, medication axis, counts[meds, visits]) trimmed to the occupied range."""
+        grid = self._cells('visits_meds', region, risk).sum(axis=(0, 1))
+        vis, med = np.nonzero(grid)
+        if not len(vis): return np.arange(1), np.arange(1), np.zeros((1, 1), dtype=np.int64)
+        grid = grid[:vis.max() + 1, :med.max() + 1]
+        return np.arange(grid.shape[0]), np.arange(grid.shape[1]), grid.T
+
+    def sample(self, n=2000, region=None, risk=None):
+        """Stratified sample of up to n rows (SAMPLE_COLS + region + risk_category).
+
+        Every region x risk cell contributes in proportion to its row count (largest
+        remainders round), taking the prefix of its key-ordered rows: a uniform sample
+        of the cell, and the same rows for the same filter on every rerun.
+        """
+        ri, ki = self._index(self.regions, region), self._index(self.risks, risk)
+        counts = self.arrays['count'][ri][:, ki]
+        total = int(counts.sum())
+        n = min(n, total)
+        quota = counts * (n / total) if total else counts * 0.0
+        take = np.floor(quota).astype(np.int64)
+        rest = n - int(take.sum())
+        if rest: take.ravel()[np.argsort(-(quota - take).ravel(), kind='stable')[:rest]] += 1
+        mask = np.arange(SAMPLE_PER_CELL) < np.minimum(take, SAMPLE_PER_CELL)[..., None]
+
+        out = {}
+        for c in SAMPLE_COLS:
+            v = self.arrays[f'sample_{c}'][ri][:, ki][mask]
+            # Whole-number columns go out as the smallest integer type: a smaller chart payload
+            out[c] = pd.to_numeric(v.astype(np.int64), downcast='integer') if len(v) and np.array_equal(v, np.round(v)) else v
+        regions, risks = np.asarray(self.regions, dtype=object)[ri], np.asarray(self.risks, dtype=object)[ki]
+        out['region'] = np.broadcast_to(regions[:, None, None], mask.shape)[mask]
+        out['risk_category'] = pd.Categorical(np.broadcast_to(risks[None, :, None], mask.shape)[mask], categories=self.risks)
+        return pd.DataFrame(out)
+
+
+# ==========================================
+# 2. BUILD / LOAD (tied to the columnar store)
+# ==========================================
+def build_cube(source=SOURCE_CSV):
+    df = read_table(None, source)
+    df = df[[c for c in NEEDED if c in df.columns] + [c for c in df.columns if 'proc_' in c]]
+    regions = list(df['region'].cat.categories) if isinstance(df['region'].dtype, pd.CategoricalDtype) else None
+    cube = Cube.from_frame(df, regions=regions)
+    if HAS_ARROW:
+        cube.meta = {'data_version': data_version(source)}
+        cube.save(_cube_path(source))
+    return cube
+
+
+def load_cube(source=SOURCE_CSV):
+    """Cube for the current store, rebuilt only when the store's rows changed."""
+    if not os.path.exists(source): return None
+    if not HAS_ARROW: return build_cube(source)
+    path = _cube_path(source)
+    if os.path.exists(path):
+        cube = Cube.load(path)
+        if cube.meta.get('version') == CUBE_VERSION and cube.meta.get('data_version') == data_version(source): return cube
+    return build_cube(source)
+
+
+def update_cube(batch, prev_version, source=SOURCE_CSV):
+    """Fold an appended batch into the persisted cube instead of rebuilding it.
+
+    `prev_version` is the store's data_version before the append; if the cube on
+    disk is not at that version it is rebuilt from the store instead.
+    """
+    path = _cube_path(source)
+    cube = Cube.load(path) if os.path.exists(path) else None
+    if cube is None or cube.meta.get('version') != CUBE_VERSION or cube.meta.get('data_version') != prev_version:
+        return build_cube(source)
+    cube.add(batch)
+    cube.meta['data_version'] = data_version(source)
+    cube.save(path)
+    return cube
@@ -0,0 +1,62 @@
+"""Score a member file in chunks.
+
+    python -m batch_score members.csv predictions.csv --model "Gradient Boosting"
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+from datastore import SOURCE_CSV
+from registry import SOURCES, ModelRegistry, is_servable, predict_batch
+
+OUTPUT_COL = 'predicted_annual_medical_cost'
+
+
+def score_file(src, dst, model_type="Random Forest", chunksize=100_000, id_col='person_id', level=None, source=None):
+    # Any servable artifact of `source` (member files carry the notebook models' full rows), else a live model trained now
+    registry = ModelRegistry()
+    hit = registry.load(model_type, servable=is_servable, source=source)
+    if hit is None and source == 'notebook': raise RuntimeError(f"No servable notebook artifact for {model_type}")
+    if hit is None:
+        if not os.path.exists(SOURCE_CSV): raise RuntimeError(f"Model unavailable: {SOURCE_CSV} missing")
+        from training import train_model
+        model = train_model(model_type)
+        registry.save(model_type, model, model.feature_encoder.features)
+        hit = model, model.feature_encoder.features
+    model, features = hit
+
+    rows = 0
+    for i, chunk in enumerate(pd.read_csv(src, chunksize=chunksize)):
+        if level is None: out = pd.DataFrame({OUTPUT_COL: predict_batch(model, features, chunk)})
+        else:
+            # Interval bounds come out of the same predict call
+            pred, lower, upper = predict_batch(model, features, chunk, level=level)
+            out = pd.DataFrame({OUTPUT_COL: pred, f'{OUTPUT_COL}_lower': lower, f'{OUTPUT_COL}_upper': upper})
+        if id_col in chunk.columns: out.insert(0, id_col, chunk[id_col].to_numpy())
+        out.to_csv(dst, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        rows += len(chunk)
+    return rows
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog='batch_score', description="Score a member CSV with a live model.")
+    p.add_argument('src', help="Input CSV with age, bmi, sex, smoker, region, dependents columns (all of medical_insurance.csv's for notebook models)")
+    p.add_argument('dst', help="Output CSV path")
+    p.add_argument('--model', default="Random Forest")
+    p.add_argument('--chunksize', type=int, default=100_000)
+    p.add_argument('--id-col', default='person_id', help="Column copied through to the output, if present")
+    p.add_argument('--source', choices=SOURCES, help="Only use the live-trained or the notebook artifact (default: live, else notebook)")
+    p.add_argument('--level', type=float, help="Also write prediction interval bounds at this level (0.5, 0.8, 0.9 or 0.95)")
+    args = p.parse_args(argv)
+
+    t0 = time.perf_counter()
+    rows = score_file(args.src, args.dst, args.model, args.chunksize, args.id_col, args.level, args.source)
+    dt = time.perf_counter() - t0
+    print(f"Scored {rows:,} rows with {args.model} in {dt:.2f}s ({rows / max(dt, 1e-9):,.0f} rows/s) -> {args.dst}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+"""End-to-end benchmark of the data, training, inference and page-render paths.
+
+    python -m benchmark                                   # 10k / 100k / 1M synthetic rows
+    python -m benchmark --sizes 10000 100000 --json bench.json
+    python -m benchmark --baseline bench.json --check     # exit 1 on a regression
+    python -m benchmark --write-csv synthetic.csv --rows 100000
+
+Every size runs in a fresh interpreter inside a scratch directory holding a
+synthetic medical_insurance.csv (same columns, types and marginals as the real
+file) with its own columnar store, cube and model registry: the project's data and
+models are never touched and no cache carries over from one size to the next.
+
+All results are seconds, keyed '<step>.<detail>' per size. A run fails --check when
+a page or the incremental append raises, a metric is over its budget in BUDGETS, or (with --baseline) a
+metric is slower than the baseline by more than --tolerance.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SIZES = [10_000, 100_000, 1_000_000]
+FIT_ROWS = 5000         # Rows per timed fit (the old fixed live-training sample), so fits compare across sizes
+PREDICT_ROWS = 1000     # Batch size of the batched predict_live timing
+SINGLE_CALLS = 50       # Single-profile calls per model (median reported)
+APPEND_ROWS = 500       # Rows of the appended claim batch
+TOLERANCE = 1.25        # Slower than baseline x this is a regression...
+MIN_DELTA_S = {'predict_single': 0.0005, 'predict_interval': 0.0005, 'predict_batch': 0.002, 'encode_single': 0.0005}  # ...and this much slower (timer noise),
+DEFAULT_DELTA_S = 0.02                                                                                                 # per step
+
+# Absolute ceilings at every size: user-facing latencies must not grow with the population
+BUDGETS = {
+    'predict_single': 0.025,
+    'predict_interval': 0.025,
+    'page_cold': 10.0,
+    'page_warm': 3.0,
+}
+
+# ==========================================
+# 1. SYNTHETIC DATA (medical_insurance.csv schema)
+# ==========================================
+COLUMNS = [
+    'person_id', 'age', 'sex', 'region', 'urban_rural', 'income', 'education', 'marital_status',
+    'employment_status', 'household_size', 'dependents', 'bmi', 'smoker', 'alcohol_freq', 'visits_last_year',
+    'hospitalizations_last_3yrs', 'days_hospitalized_last_3yrs', 'medication_count', 'systolic_bp',
+    'diastolic_bp', 'ldl', 'hba1c', 'plan_type', 'network_tier', 'deductible', 'copay', 'policy_term_years',
+    'policy_changes_last_2yrs', 'provider_quality', 'risk_score', 'hypertension', 'diabetes', 'asthma', 'copd',
+    'cardiovascular_disease', 'cancer_history', 'kidney_disease', 'liver_disease', 'arthritis', 'mental_health',
+    'chronic_count', 'annual_medical_cost', 'annual_premium', 'monthly_premium', 'claims_count',
+    'avg_claim_amount', 'total_claims_paid', 'proc_imaging_count', 'proc_surgery_count', 'proc_physio_count',
+    'proc_consult_count', 'proc_lab_count', 'is_high_risk', 'had_major_procedure',
+]
+# name -> (levels, probabilities); None is a missing value
+CATEGORIES = {
+    'sex': (['Male', 'Female', 'Other'], [.49, .489, .021]),
+    'region': (['South', 'North', 'East', 'West', 'Central'], [.283, .222, .194, .181, .12]),
+    'urban_rural': (['Urban', 'Suburban', 'Rural'], [.603, .251, .146]),
+    'education': (['HS', 'Some College', 'Doctorate', 'Masters', 'No HS', 'Bachelors'], None),
+    'marital_status': (['Widowed', 'Divorced', 'Single', 'Married'], None),
+    'employment_status': (['Employed', 'Retired', 'Self-employed', 'Unemployed'], None),
+    'smoker': (['Never', 'Former', 'Current'], [.602, .248, .15]),
+    'alcohol_freq': (['Occasional', 'Weekly', 'Daily', None], [.255, .251, .242, .252]),
+    'plan_type': (['HMO', 'POS', 'PPO', 'EPO'], None),
+    'network_tier': (['Gold', 'Silver', 'Premium', 'Platinum', 'Bronze'], None),
+    'household_size': ([1, 2, 3, 4, 5, 6], None),
+    'dependents': ([0, 1, 2, 3], None),
+    'deductible': ([500, 1000, 2000, 5000], None),
+    'copay': ([10, 20, 30, 50], None),
+    'policy_term_years': (list(range(1, 10)), None),
+    'policy_changes_last_2yrs': ([0, 1, 2, 3], None),
+}
+COUNTS = {  # Poisson means
+    'visits_last_year': 1.9, 'hospitalizations_last_3yrs': 0.29, 'days_hospitalized_last_3yrs': 1.0,
+    'medication_count': 1.2, 'claims_count': 3.0, 'proc_imaging_count': 0.5, 'proc_surgery_count': 0.5,
+    'proc_physio_count': 0.5, 'proc_consult_count': 0.5, 'proc_lab_count': 0.5,
+}
+VITALS = {  # (mean, sd, min, max)
+    'systolic_bp': (118, 15, 61, 181), 'diastolic_bp': (77, 10, 34, 115),
+    'ldl': (120, 30, -9, 237.4), 'hba1c': (5.6, 0.7, 2.7, 8.7),
+}
+CONDITIONS = ['hypertension', 'diabetes', 'asthma', 'copd', 'cardiovascular_disease', 'cancer_history',
+              'kidney_disease', 'liver_disease', 'arthritis', 'mental_health']
+SMOKER_COST = {'Never': 0, 'Former': 600, 'Current': 2000}
+
+
+def synthetic_frame(rows, seed=0, first_id=1):
+    """`rows` synthetic members; cost depends on age, BMI, smoking and conditions so models have signal."""
+    rng = np.random.default_rng(seed)
+    df = {'person_id': np.arange(first_id, first_id + rows), 'age': rng.integers(0, 101, rows)}
+    for name, (levels, p) in CATEGORIES.items():
+        df[name] = np.asarray(levels, dtype=object)[rng.choice(len(levels), rows, p=p)]
+    df['income'] = np.maximum(np.round(rng.lognormal(10.5, 0.75, rows), -2), 1700.0)
+    df['bmi'] = np.round(np.clip(rng.normal(27, 5, rows), 12, 45.5), 1)
+    for name, lam in COUNTS.items(): df[name] = rng.poisson(lam, rows)
+    for name, (mu, sd, lo, hi) in VITALS.items(): df[name] = np.round(np.clip(rng.normal(mu, sd, rows), lo, hi), 1)
+    df['provider_quality'] = np.round(rng.uniform(1, 5, rows), 2)
+    df['risk_score'] = np.round(rng.uniform(0, 1, rows), 3)
+    for name in CONDITIONS: df[name] = (rng.random(rows) < 0.08).astype(np.int64)
+    df['chronic_count'] = sum(df[name] for name in CONDITIONS)
+    cost = (2500 + 40 * df['age'] + 60 * (df['bmi'] - 27) + pd.Series(df['smoker']).map(SMOKER_COST).to_numpy()
+            + 350 * df['chronic_count'] + 500 * df['hospitalizations_last_3yrs'] + rng.normal(0, 600, rows))
+    df['annual_medical_cost'] = np.round(np.maximum(cost, 500), 2)
+    df['annual_premium'] = np.round(700 + 0.26 * df['annual_medical_cost'] + rng.normal(0, 300, rows).clip(-500), 2)
+    df['monthly_premium'] = np.round(df['annual_premium'] / 12, 2)
+    df['avg_claim_amount'] = np.round(rng.gamma(2.0, 200, rows) + 1, 2)
+    df['total_claims_paid'] = np.round(df['claims_count'] * df['avg_claim_amount'], 2)
+    df['is_high_risk'] = (df['risk_score'] > 0.603).astype(np.int64)
+    df['had_major_procedure'] = (rng.random(rows) < 0.05).astype(np.int64)
+    return pd.DataFrame(df)[COLUMNS]
+
+
+def write_synthetic(path, rows, seed=0, chunk_rows=200_000):
+    """Write `rows` synthetic members to `path` in chunks (1M rows never sit in memory at once)."""
+    for i, start in enumerate(range(0, rows, chunk_rows)):
+        chunk = synthetic_frame(min(chunk_rows, rows - start), seed + i, first_id=start + 1)
+        chunk.to_csv(path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+    return path
+
+
+# ==========================================
+# 2. ONE SIZE (runs in its own interpreter)
+# ==========================================
+def _timed(fn, repeat=1):
+    # (best wall-clock seconds, last result)
+    best, out = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter(); out = fn(); dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, out
+
+
+def _pages():
+    pages = [os.path.join(ROOT, 'Home.py')] + sorted(
+        os.path.join(ROOT, 'Pages', f) for f in os.listdir(os.path.join(ROOT, 'Pages')) if f.endswith('.py'))
+    # "Pages/2_⚠️_Risk_Stratification.py" -> "Risk_Stratification"
+    return {os.path.splitext(os.path.basename(p))[0].split('_', 2)[-1]: p for p in pages}
+
+
+def _time_csv(res):
+    # The raw frame is freed when this returns, before the store is built
+    from datastore import SOURCE_CSV, add_derived, compact
+    res['data.csv_read'], df = _timed(lambda: pd.read_csv(SOURCE_CSV))
+    res['data.derive'], _ = _timed(lambda: compact(add_derived(df)))
+
+
+def _time_notebook_features(res):
+    # Notebook feature pipeline: fit, then the whole store in reused 100k-row blocks, then one row
+    from datastore import read_table
+    from features import NOTEBOOK_INPUTS, NotebookEncoder
+    frame = read_table(NOTEBOOK_INPUTS)
+    res['data.notebook_fit'], nb = _timed(lambda: NotebookEncoder.fit(frame))
+    block = np.empty((len(nb.features), min(len(frame), 100_000))).T
+    def encode_all():
+        for start in range(0, len(frame), len(block)):
+            chunk = frame.iloc[start:start + len(block)]
+            nb.transform(chunk, out=block[:len(chunk)])
+    res['data.notebook_features'], _ = _timed(encode_all, repeat=3)
+    row = {k: v.item() if hasattr(v, 'item') else v for k, v in frame.iloc[0].items()}
+    res['encode_single.notebook'] = float(np.median([_timed(lambda: nb.transform(row))[0] for _ in range(SINGLE_CALLS)]))
+
+
+def run_size(rows, workdir, fit_rows=FIT_ROWS, models=None, page_timeout=300):
+    """{metric: seconds} for one synthetic population of `rows` members, plus page errors."""
+    os.chdir(workdir)
+    if ROOT not in sys.path: sys.path.insert(0, ROOT)
+    import warnings
+    warnings.filterwarnings('ignore')
+    # Child process only: Streamlit's bare-mode and deprecation warnings would bury the report
+    # (failures still reach the parent, as exceptions or in 'errors')
+    os.dup2(os.open(os.devnull, os.O_WRONLY), 2)
+    import datastore
+    from aggregates import build_cube
+    from datastore import SOURCE_CSV, ingest, read_table
+    from registry import ModelRegistry, is_servable, predict_batch
+    from training import RAW_FEATURES, fit_model, load_training_data, model_types, train_model
+    from utils import predict_live
+
+    res, errors = {}, {}
+    t0 = time.perf_counter(); write_synthetic(SOURCE_CSV, rows); generate_s = time.perf_counter() - t0
+
+    # --- data ------------------------------------------------------------
+    _time_csv(res)
+    res['data.store_build'], _ = _timed(lambda: ingest(SOURCE_CSV))
+    res['data.store_read'], _ = _timed(lambda: (datastore._TABLES.clear(), read_table())[1], repeat=3)
+    res['data.cube_build'], _ = _timed(build_cube)
+    res['data.encode'], (encoder, X, y) = _timed(load_training_data, repeat=3)
+
+    _time_notebook_features(res)
+
+    # --- fit (fixed rows, so the step is comparable) + save through the registry ---
+    reg = ModelRegistry()
+    n = min(fit_rows, len(X))
+    for name in models or model_types():
+        fit_model(name, encoder, X[:100], y[:100])  # Warm-up: lazy estimator imports are not fit time
+        res[f'fit.{name}'], model = _timed(lambda: fit_model(name, encoder, X[:n], y[:n]))
+        res[f'save.{name}'], _ = _timed(lambda: reg.save(name, model, encoder.features))
+    res['fit.Linear Regression (streamed)'], _ = _timed(lambda: train_model("Linear Regression"))
+
+    # --- predict_live: one profile, and one batch, through the served artefacts ---
+    profiles = read_table(RAW_FEATURES + ['dependents']).iloc[:PREDICT_ROWS]
+    one = {k: v.item() if hasattr(v, 'item') else v for k, v in profiles.iloc[0].items()}
+    served = ModelRegistry()
+    for name in models or model_types():
+        model, features = served.load(name, servable=is_servable)
+        predict_live(model, features, one)
+        single = [_timed(lambda: predict_live(model, features, one))[0] for _ in range(SINGLE_CALLS)]
+        res[f'predict_single.{name}'] = float(np.median(single))
+        ranged = [_timed(lambda: predict_live(model, features, one, level=0.9))[0] for _ in range(SINGLE_CALLS)]
+        res[f'predict_interval.{name}'] = float(np.median(ranged))
+        res[f'predict_batch.{name}'], _ = _timed(lambda: predict_batch(model, features, profiles), repeat=3)
+
+    # --- headless page renders (cold: first run in this process; warm: rerun) ---
+    from streamlit.testing.v1 import AppTest
+    for label, path in _pages().items():
+        at = AppTest.from_file(path, default_timeout=page_timeout)
+        res[f'page_cold.{label}'], _ = _timed(at.run)
+        res[f'page_warm.{label}'], _ = _timed(at.run)
+        if at.exception: errors[label] = at.exception[0].value
+
+    # --- incremental append (store, cube and models); its IDs are past the int32 range ---
+    from incremental import apply_batch
+    batch = os.path.join(workdir, 'batch.csv')
+    synthetic_frame(APPEND_ROWS, seed=rows, first_id=2**31).to_csv(batch, index=False)
+    try: res['append.batch'], _ = _timed(lambda: apply_batch(batch))
+    except Exception as e: errors['incremental append'] = repr(e)
+    return {'metrics': res, 'errors': errors, 'generate_s': generate_s}
+
+
+def _run_isolated(rows, keep=False, **kw):
+    # Fresh interpreter + scratch directory per size: no module, Streamlit or OS-path cache is shared
+    workdir = tempfile.mkdtemp(prefix=f'bench-{rows}-')
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            return pool.submit(run_size, rows, workdir, **kw).result()
+    finally:
+        if keep: print(f"kept {workdir}", file=sys.stderr)
+        else: shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ==========================================
+# 3. THRESHOLDS + REPORT
+# ==========================================
+def check(results, baseline=None, tolerance=TOLERANCE):
+    """Failure messages: page errors, budget overruns and regressions against `baseline`."""
+    failures = []
+    for size, run in results['sizes'].items():
+        failures += [f"{size} rows: {p} raised {e}" for p, e in run['errors'].items()]
+        for metric, value in run['metrics'].items():
+            step = metric.split('.', 1)[0]
+            budget = BUDGETS.get(step)
+            if budget is not None and value > budget:
+                failures.append(f"{size} rows: {metric} {value:.3f}s over budget {budget}s")
+            ref = ((baseline or {}).get('sizes', {}).get(size) or {}).get('metrics', {}).get(metric)
+            if ref is not None and value > ref * tolerance and value - ref > MIN_DELTA_S.get(step, DEFAULT_DELTA_S):
+                failures.append(f"{size} rows: {metric} {value:.3f}s vs baseline {ref:.3f}s ({value / ref:.2f}x)")
+    return failures
+
+
+def _fmt(seconds):
+    return f"{seconds:8.2f} s " if seconds >= 1 else f"{seconds * 1e3:8.2f} ms"
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog='benchmark', description="Benchmark data, training, inference and page renders on synthetic data.")
+    p.add_argument('--sizes', nargs='*', type=int, default=SIZES, help="Synthetic population sizes (rows)")
+    p.add_argument('--models', nargs='*', help="Subset of model names (default: all available)")
+    p.add_argument('--fit-rows', type=int, default=FIT_ROWS, help="Rows per timed fit")
+    p.add_argument('--json', help="Write the results to this path")
+    p.add_argument('--baseline', help="Earlier --json output to compare against")
+    p.add_argument('--tolerance', type=float, default=TOLERANCE, help="Allowed slowdown ratio vs the baseline")
+    p.add_argument('--check', action='store_true', help="Exit 1 on a page error, budget overrun or regression")
+    p.add_argument('--keep', action='store_true', help="Keep the scratch directories")
+    p.add_argument('--write-csv', help="Only write a synthetic CSV of --rows members to this path")
+    p.add_argument('--rows', type=int, default=SIZES[0])
+    args = p.parse_args(argv)
+
+    if args.write_csv:
+        write_synthetic(args.write_csv, args.rows)
+        print(f"{args.rows:,} synthetic rows -> {args.write_csv}", file=sys.stderr)
+        return
+
+    results = {'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count(), 'fit_rows': args.fit_rows,
+                        'started': pd.Timestamp.now().isoformat(timespec='seconds')}, 'sizes': {}}
+    for rows in args.sizes:
+        run = _run_isolated(rows, args.keep, fit_rows=args.fit_rows, models=args.models)
+        results['sizes'][str(rows)] = run
+        print(f"--- {rows:,} rows (generated in {run['generate_s']:.1f}s)", file=sys.stderr)
+        for metric, value in run['metrics'].items(): print(f"  {metric:50s} {_fmt(value)}", file=sys.stderr)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f)
+    failures = check(results, baseline, args.tolerance)
+    results['failures'] = failures
+    for msg in failures: print(f"FAIL {msg}", file=sys.stderr)
+
+    if args.json:
+        with open(args.json, 'w') as f: json.dump(results, f, indent=2)
+    if args.check and failures: sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
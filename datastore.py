@@ -0,0 +1,219 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+# ==========================================
+# 1. PATHS & SCHEMA
+# ==========================================
+SOURCE_CSV = 'medical_insurance.csv'
+CACHE_DIR = '.cache'
+STORE_VERSION = 3  # Bump when the derived columns / typing below change
+# Kept at full width: IDs keep growing in appended batches, and the target is what models train on
+WIDE_COLS = {'person_id': 'int64', 'annual_medical_cost': 'float64'}
+
+RISK_LABELS = ['Low', 'Medium', 'High']
+
+
+def _paths(source):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(CACHE_DIR, f'{stem}.arrow'), os.path.join(CACHE_DIR, f'{stem}.meta.json')
+
+
+def _part_path(source, n):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(CACHE_DIR, f'{stem}.part-{n:05d}.arrow')
+
+
+def file_hash(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''): h.update(block)
+    return h.hexdigest()
+
+
+# ==========================================
+# 2. INGEST (CSV -> typed columnar file)
+# ==========================================
+def add_derived(df, risk_edges=None):
+    # Dashboard columns, computed once at ingest instead of per page load
+    if 'income' not in df.columns: df['income'] = 50000
+    if 'risk_score' not in df.columns and {'age', 'bmi'} <= set(df.columns):
+        df['risk_score'] = (df['age'] * 0.4) + (df['bmi'] * 0.6)
+    if 'risk_category' not in df.columns:
+        try:
+            if risk_edges is None:
+                df['risk_category'], edges = pd.qcut(df['risk_score'], q=[0, .33, .66, 1], labels=RISK_LABELS, retbins=True)
+                df.attrs['risk_edges'] = [float(e) for e in edges]
+            else:
+                # Appended batches reuse the base population's tertiles
+                bins = [-np.inf] + list(risk_edges[1:-1]) + [np.inf]
+                df['risk_category'] = pd.cut(df['risk_score'], bins=bins, labels=RISK_LABELS)
+        except Exception: df['risk_category'] = pd.Categorical(['Medium'] * len(df), categories=RISK_LABELS)
+    return df
+
+
+def _fits(s, dtype):
+    info = np.iinfo(dtype)
+    return len(s) == 0 or (info.min <= s.min() and s.max() <= info.max)
+
+
+def compact(df):
+    # Strings -> dictionary-encoded categoricals, floats -> float32, integers -> int32 (int64 if
+    # needed): the base file fixes the schema every appended batch is cast to, so counts get headroom
+    for col in df.columns:
+        s = df[col]
+        if col in WIDE_COLS and pd.api.types.is_numeric_dtype(s): df[col] = s.astype(WIDE_COLS[col]); continue
+        if isinstance(s.dtype, pd.CategoricalDtype): continue
+        if pd.api.types.is_bool_dtype(s): continue
+        if pd.api.types.is_integer_dtype(s): df[col] = s.astype(np.int32 if _fits(s, np.int32) else np.int64)
+        elif pd.api.types.is_float_dtype(s): df[col] = pd.to_numeric(s, downcast='float')
+        elif s.nunique(dropna=True) <= max(len(s) // 2, 1): df[col] = s.astype('category')
+    return df
+
+
+def _write_meta(meta_path, meta):
+    tmp = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f: json.dump(meta, f)
+    os.replace(tmp, meta_path)
+
+
+def ingest(source=SOURCE_CSV, src_hash=None):
+    """Parse the CSV once and write the typed Arrow file + its metadata."""
+    target, meta_path = _paths(source)
+    df = compact(add_derived(pd.read_csv(source)))
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = f'{target}.{os.getpid()}.tmp'
+    # Uncompressed IPC so readers can memory-map it
+    feather.write_feather(df, tmp, compression='uncompressed')
+    os.replace(tmp, target)
+    # A full rebuild drops appended parts; their batches are re-applied by the next append run
+    old = _read_meta(meta_path) or {}
+    for part in old.get('parts', []):
+        try: os.remove(os.path.join(CACHE_DIR, part['file']))
+        except OSError: pass
+    stat = os.stat(source)
+    _write_meta(meta_path, {'version': STORE_VERSION, 'mtime': stat.st_mtime, 'size': stat.st_size,
+                            'sha256': src_hash or file_hash(source), 'rows': len(df),
+                            'risk_edges': df.attrs.get('risk_edges'), 'parts': [],
+                            'data_version': old.get('data_version', 0) + 1})
+    return target
+
+
+def append_batch(batch_path, source=SOURCE_CSV):
+    """Append one CSV batch to the store as a new Arrow part (no rewrite of existing data).
+
+    Returns the appended rows as a DataFrame, or None if this batch was already applied.
+    """
+    ensure_store(source)
+    target, meta_path = _paths(source)
+    meta = _read_meta(meta_path)
+    batch_hash = file_hash(batch_path)
+    if any(p['sha256'] == batch_hash for p in meta['parts']): return None
+
+    schema = pa.ipc.open_file(pa.memory_map(target)).schema
+    df = add_derived(pd.read_csv(batch_path), meta.get('risk_edges'))
+    df = df[[c for c in schema.names if c in df.columns]]
+    missing = [c for c in schema.names if c not in df.columns]
+    if missing: raise ValueError(f"{batch_path}: missing columns {missing}")
+    # Cast to the base schema so parts concatenate zero-copy. An integer column whose new values
+    # overflow it is widened to int64 in this part; open_table promotes the other parts to match
+    fields = [f.with_type(pa.int64()) if pa.types.is_integer(f.type) and pd.api.types.is_integer_dtype(df[f.name])
+              and not _fits(df[f.name], f.type.to_pandas_dtype()) else f for f in schema]
+    table = pa.Table.from_pandas(df, schema=pa.schema(fields, metadata=schema.metadata), preserve_index=False, safe=True)
+
+    n = len(meta['parts']) + 1
+    path = _part_path(source, n)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    feather.write_feather(table, tmp, compression='uncompressed')
+    os.replace(tmp, path)
+    meta['parts'].append({'file': os.path.basename(path), 'source': os.path.basename(batch_path),
+                          'sha256': batch_hash, 'rows': len(df)})
+    meta['rows'] += len(df)
+    meta['data_version'] = meta.get('data_version', 0) + 1
+    _write_meta(meta_path, meta)
+    return df
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as f: return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def store_meta(source=SOURCE_CSV):
+    return _read_meta(_paths(source)[1])
+
+
+def ensure_store(source=SOURCE_CSV):
+    """Path to an up-to-date columnar copy of `source`, rebuilding it if stale."""
+    target, meta_path = _paths(source)
+    meta = _read_meta(meta_path)
+    if meta is None or meta.get('version') != STORE_VERSION or not os.path.exists(target):
+        return ingest(source)
+    stat = os.stat(source)
+    if meta['mtime'] == stat.st_mtime and meta['size'] == stat.st_size: return target
+    # mtime moved: only rebuild if the content actually changed
+    src_hash = file_hash(source)
+    if src_hash != meta['sha256']: return ingest(source, src_hash)
+    meta['mtime'] = stat.st_mtime
+    _write_meta(meta_path, meta)
+    return target
+
+
+def data_version(source=SOURCE_CSV):
+    """Changes whenever the store's rows change (rebuild or appended batch)."""
+    if not os.path.exists(source): return None
+    if not HAS_ARROW: return os.stat(source).st_mtime_ns
+    ensure_store(source)
+    meta = store_meta(source)
+    return f"{meta['sha256'][:16]}:{meta.get('data_version', 0)}"
+
+
+# ==========================================
+# 3. READ (memory-mapped, with column projection)
+# ==========================================
+_TABLES = {}
+
+
+def open_table(source=SOURCE_CSV):
+    """Memory-mapped Arrow table over the store (base file + appended parts).
+
+    Opened once per process and per data version. Every worker process maps the
+    same files, so the OS page cache holds one copy of the data no matter how many
+    processes or sessions read it.
+    """
+    path = ensure_store(source)
+    meta = store_meta(source)
+    key = (path, meta['sha256'], meta.get('data_version', 0))
+    if key not in _TABLES:
+        _TABLES.clear()  # Store changed: drop the stale mapping
+        tables = [feather.read_table(path, memory_map=True)]
+        tables += [feather.read_table(os.path.join(CACHE_DIR, p['file']), memory_map=True) for p in meta['parts']]
+        _TABLES[key] = tables[0] if len(tables) == 1 else pa.concat_tables(tables, promote_options='permissive')
+    return _TABLES[key]
+
+
+def read_table(columns=None, source=SOURCE_CSV):
+    if not os.path.exists(source): return None
+    if not HAS_ARROW:
+        df = add_derived(pd.read_csv(source))
+        return df if columns is None else df[[c for c in columns if c in df.columns]]
+    table = open_table(source)
+    if columns is not None: table = table.select([c for c in columns if c in table.schema.names])
+    # split_blocks keeps each column a read-only view over the mapped file (no copy)
+    return table.to_pandas(split_blocks=True, self_destruct=False)
+
+def column_names(source=SOURCE_CSV):
+    if not os.path.exists(source): return []
+    if not HAS_ARROW: return list(pd.read_csv(source, nrows=0).columns)
+    return open_table(source).schema.names
@@ -0,0 +1,376 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 1. LIVE FEATURE ENCODER
+# ==========================================
+SEX_CODES = {'Female': 0, 'Male': 1}
+SMOKER_CODES = {'Never': 0, 'Former': 1, 'Current': 2}
+REGIONS = ['North', 'South', 'East', 'West']
+
+
+def _column(data, name):
+    # Column from a DataFrame (as its Series), Arrow table or single-profile dict (as 1-D arrays)
+    if isinstance(data, dict): return np.atleast_1d(np.asarray(data[name])) if name in data else None
+    if name not in (data.column_names if hasattr(data, 'column_names') else data.columns): return None
+    col = data[name]
+    if isinstance(col, pd.Series): return col
+    return col.to_numpy() if hasattr(col, 'to_numpy') else np.asarray(col)
+
+
+def _values(data, name):
+    # Column as a 1-D NumPy array
+    col = _column(data, name)
+    return col.to_numpy() if isinstance(col, pd.Series) else col
+
+
+def _gather(table, values, small_batch):
+    # Category -> lookup-table row; unknown / missing values get the trailing row
+    index, pos, lut = table
+    if len(values) <= small_batch:
+        codes = np.fromiter((pos.get(v, -1) for v in values), dtype=np.intp, count=len(values))
+    else:
+        # Each distinct value is resolved once (factorize is hash-based on strings, free on categoricals)
+        codes, uniques = pd.factorize(values)
+        codes = np.append(index.get_indexer(uniques), -1)[codes]
+    return lut[codes]
+
+
+class FeatureEncoder:
+    """Raw profile columns -> live model matrix, identical for training and serving.
+
+    Categoricals are resolved to integer codes (pd.Index.get_indexer, or dict lookups
+    for small inputs) and then gathered from NumPy lookup tables. Unknown / missing
+    categories get code -1, which indexes the trailing "unknown" row of every table.
+    """
+    VERSION = 1
+    SMALL_BATCH = 64  # Below this, dict lookups beat get_indexer's setup cost
+
+    def __init__(self, dep_col='dependents', regions=REGIONS):
+        self.version = self.VERSION
+        self.dep_col = dep_col
+        self.regions = list(regions)
+        self.features = ['age', 'bmi', 'sex_code', 'smoker_code', dep_col] + [f'region_{r}' for r in self.regions]
+        self._build()
+
+    def _build(self):
+        # name -> (vocabulary index, dict positions, lookup table with trailing "unknown" row)
+        self._tables = {}
+        for name, vocab, lut in [
+            ('sex', list(SEX_CODES), list(SEX_CODES.values()) + [0]),
+            ('smoker', list(SMOKER_CODES), list(SMOKER_CODES.values()) + [0]),
+            ('region', self.regions, np.vstack([np.eye(len(self.regions)), np.zeros(len(self.regions))])),
+        ]:
+            self._tables[name] = (pd.Index(vocab), {k: i for i, k in enumerate(vocab)}, np.asarray(lut, dtype=np.float64))
+
+    def _lookup(self, name, values):
+        return _gather(self._tables[name], values, self.SMALL_BATCH)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in [k for k in state if k.startswith('_')]: del state[k]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build()
+
+    @classmethod
+    def fit(cls, df):
+        dep_col = 'children' if 'children' in df.columns else 'dependents'
+        return cls(dep_col=dep_col)
+
+    def _smoker_values(self, v):
+        # UI toggle sends booleans: True -> Current, False -> Never
+        if v.dtype == bool: return np.where(v, 'Current', 'Never')
+        if v.dtype == object: return np.where(v == True, 'Current', np.where(v == False, 'Never', v))  # noqa: E712
+        return v
+
+    def transform(self, data, out=None):
+        """Encode a DataFrame, Arrow table/batch or single-profile dict into float64 rows."""
+        age = _values(data, 'age')
+        n = len(age)
+        X = out if out is not None else np.empty((n, len(self.features)), dtype=np.float64)
+        X[:, 0] = age
+        X[:, 1] = _values(data, 'bmi')
+
+        sex = _values(data, 'sex')
+        X[:, 2] = 0 if sex is None else self._lookup('sex', sex)
+        smoker = _values(data, 'smoker')
+        X[:, 3] = 0 if smoker is None else self._lookup('smoker', self._smoker_values(smoker))
+
+        dep = _values(data, self.dep_col)
+        if dep is None: dep = _values(data, 'children' if self.dep_col == 'dependents' else 'dependents')
+        X[:, 4] = 0 if dep is None else dep
+
+        region = _values(data, 'region')
+        X[:, 5:] = 0 if region is None else self._lookup('region', region)
+        return X
+
+
+# ==========================================
+# 2. NOTEBOOK FEATURE PIPELINE
+# ==========================================
+# The notebook's feature-engineering cell, column for column, in the layout of
+# Trained_Models/feature_columns.pkl. Its quirks are kept because the pickled models were
+# fitted on them: the procedure and 'cardiovascular' columns it looks for don't exist
+# (total_procedures is 0, cardiovascular_risk is hypertension + diabetes), and smoker
+# only maps 'Yes' / 1, so Never / Former / Current all score 0.
+NOTEBOOK_RAW = [
+    'age', 'income', 'household_size', 'dependents', 'bmi', 'visits_last_year', 'hospitalizations_last_3yrs',
+    'days_hospitalized_last_3yrs', 'medication_count', 'systolic_bp', 'diastolic_bp', 'ldl', 'hba1c', 'deductible',
+    'copay', 'policy_term_years', 'policy_changes_last_2yrs', 'provider_quality', 'risk_score', 'annual_premium',
+    'monthly_premium', 'claims_count', 'avg_claim_amount', 'total_claims_paid', 'chronic_count', 'hypertension',
+    'diabetes', 'asthma', 'copd', 'cardiovascular_disease', 'cancer_history', 'kidney_disease', 'liver_disease',
+    'arthritis', 'mental_health', 'proc_imaging_count', 'proc_surgery_count', 'proc_physio_count',
+    'proc_consult_count', 'proc_lab_count', 'is_high_risk', 'had_major_procedure',
+]
+NOTEBOOK_REGIONS = ['South', 'North', 'East', 'West', 'Central']  # The notebook's top five by count
+NOTEBOOK_DERIVED = [
+    'visits_per_month', 'hosp_intensity', 'days_per_hospitalization', 'total_procedures', 'utilization_score',
+    'cardiovascular_risk', 'complex_patient', 'high_risk_patient', 'critical_conditions', 'age_chronic_interaction',
+    'age_risk_score', 'elderly_chronic', 'young_high_risk', 'premium_burden', 'deductible_to_income',
+    'out_of_pocket_risk', 'coverage_adequacy', 'is_obese', 'is_overweight', 'smoker_numeric', 'lifestyle_risk_score',
+    'bp_ratio', 'pulse_pressure', 'hypertensive', 'high_cholesterol', 'diabetic_control', 'claims_frequency',
+    'education_level', 'is_employed', 'is_retired', 'is_urban', 'gender_encoded', 'household_per_capita_income',
+    'dependents_ratio', 'has_dependents', 'large_family', 'age_squared', 'bmi_squared', 'chronic_squared',
+    'visits_squared', 'income_squared', 'log_income', 'log_premium', 'log_claims', 'log_visits', 'policy_stability',
+    'frequent_policy_changes', 'high_deductible', 'mental_health_concern',
+] + [f'region_{r}' for r in NOTEBOOK_REGIONS] + [
+    'premium_network', 'high_quality_provider', 'claims_to_premium_ratio', 'high_claims_user',
+]
+NOTEBOOK_FEATURES = NOTEBOOK_RAW + NOTEBOOK_DERIVED
+NOTEBOOK_INPUTS = NOTEBOOK_RAW + ['smoker', 'education', 'employment_status', 'urban_rural', 'sex', 'region', 'network_tier']
+
+# Population statistics the notebook computed inline: (feature, input column, quantile)
+NOTEBOOK_THRESHOLDS = [
+    ('high_risk_patient', 'risk_score', 0.75),
+    ('high_deductible', 'deductible', 0.5),
+    ('high_quality_provider', 'provider_quality', 0.5),
+    ('high_claims_user', 'claims_count', 0.75),
+]
+EDUCATION_LEVELS = {'No HS': 1, 'HS': 2, 'Some College': 3, 'Bachelors': 4, 'Masters': 5, 'Doctorate': 6}
+
+
+def _numeric(v):
+    return v.astype(np.float64, copy=False) if v.dtype.kind in 'biuf' else pd.to_numeric(v, errors='coerce').astype(np.float64)
+
+
+def _row_slice(data, start, stop):
+    return data.iloc[start:stop] if hasattr(data, 'iloc') else data.slice(start, stop - start)
+
+
+class NotebookEncoder:
+    """Raw member rows -> the notebook's 100-column model matrix, in batch or one profile at a time.
+
+    The population statistics the notebook computed inline (risk score / claims count upper
+    quartiles, deductible / provider quality medians, and the column means it fills NaNs
+    with) are fitted once and kept, so serving never looks at the population. As in pandas,
+    arithmetic on a missing input is NaN (then imputed with the fitted mean) and a
+    comparison on a missing input is 0. The matrix is column-major: every feature is
+    written in place into its own contiguous column.
+    """
+    VERSION = 1
+    SMALL_BATCH = 64
+
+    def __init__(self, thresholds, means=None):
+        self.version = self.VERSION
+        self.features = list(NOTEBOOK_FEATURES)
+        self.inputs = list(NOTEBOOK_INPUTS)
+        self.thresholds = dict(thresholds)
+        self.means = None if means is None else np.asarray(means, dtype=np.float64)
+        self._build()
+
+    def _build(self):
+        self._pos = {name: i for i, name in enumerate(self.features)}
+        employment = {'Employed': (1, 0), 'Self-employed': (1, 0), 'Retired': (0, 1)}
+        self._tables = {}
+        for name, mapping, default in [
+            ('smoker', {'Yes': 1, 'No': 0, 1: 1, 0: 0}, 0),
+            ('education', EDUCATION_LEVELS, 2),
+            ('employment_status', employment, (0, 0)),
+            ('urban_rural', {'Urban': 1}, 0),
+            ('sex', {'Male': 1, 'Female': 0, 'Other': 2}, 2),
+            ('region', {r: np.eye(len(NOTEBOOK_REGIONS))[i] for i, r in enumerate(NOTEBOOK_REGIONS)}, np.zeros(len(NOTEBOOK_REGIONS))),
+            ('network_tier', {'Premium': 1}, 0),
+        ]:
+            vocab = list(mapping)
+            lut = np.asarray([mapping[k] for k in vocab] + [default], dtype=np.float64)
+            self._tables[name] = (pd.Index(vocab, dtype=object), {k: i for i, k in enumerate(vocab)}, lut)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in [k for k in state if k.startswith('_')]: del state[k]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build()
+
+    @classmethod
+    def fit(cls, data, chunk_rows=200_000):
+        """Fit the thresholds and fill means on a DataFrame or Arrow table (the means in chunks)."""
+        thresholds = {}
+        for feature, col, q in NOTEBOOK_THRESHOLDS:
+            v = _values(data, col)
+            thresholds[feature] = float(pd.Series(_numeric(v)).quantile(q)) if v is not None else np.nan
+        enc = cls(thresholds)
+        total, count = np.zeros(len(enc.features)), np.zeros(len(enc.features))
+        for start in range(0, len(data), chunk_rows):
+            X = enc.transform(_row_slice(data, start, start + chunk_rows))
+            total += np.nansum(X, axis=0)
+            count += (~np.isnan(X)).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'): enc.means = total / count
+        return enc
+
+    def _categories(self, data, name, n):
+        v = _column(data, name)
+        if v is None: return self._tables[name][2][np.full(n, -1)]
+        if name == 'smoker' and v.dtype.kind in 'biuf': return np.nan_to_num(np.asarray(v, dtype=np.float64))  # Flags / booleans: used as is
+        return _gather(self._tables[name], v, self.SMALL_BATCH)
+
+    def transform(self, data, out=None):
+        """Encode a DataFrame, Arrow table/batch or single-profile dict into float64 rows."""
+        n = next(len(v) for v in (_values(data, c) for c in self.inputs) if v is not None)
+        X = out if out is not None else np.empty((len(self.features), n), dtype=np.float64).T
+        f = {name: X[:, i] for i, name in enumerate(self.features)}
+
+        # Raw columns first, in place; the derived features below read them from X
+        for name in NOTEBOOK_RAW:
+            v = _values(data, name)
+            if v is None: f[name][:] = np.nan
+            else: f[name][:] = _numeric(v)
+        age, income, hh, dep, bmi = f['age'], f['income'], f['household_size'], f['dependents'], f['bmi']
+        visits, hosp, meds, chronic = f['visits_last_year'], f['hospitalizations_last_3yrs'], f['medication_count'], f['chronic_count']
+        sbp, dbp, ded, copay, risk = f['systolic_bp'], f['diastolic_bp'], f['deductible'], f['copay'], f['risk_score']
+        premium, claims, paid = f['annual_premium'], f['claims_count'], f['total_claims_paid']
+        t = self.thresholds
+
+        # 1. Utilization intensity
+        np.divide(visits, 12, out=f['visits_per_month'])
+        np.divide(hosp, 3, out=f['hosp_intensity'])
+        np.add(hosp, 1, out=f['days_per_hospitalization']); np.divide(f['days_hospitalized_last_3yrs'], f['days_per_hospitalization'], out=f['days_per_hospitalization'])
+        f['total_procedures'][:] = 0
+        o = f['utilization_score']; np.multiply(hosp, 10, out=o); o += visits; o += 2 * meds
+        # 2. Risk composites (row sums skip NaN, as DataFrame.sum does)
+        o = f['cardiovascular_risk']; o[:] = 0
+        for c in ('hypertension', 'diabetes'): np.add(o, f[c], out=o, where=~np.isnan(f[c]))
+        np.minimum(o, 3, out=o)
+        f['complex_patient'][:] = chronic >= 3
+        f['high_risk_patient'][:] = risk > t['high_risk_patient']
+        o = f['critical_conditions']; o[:] = 0
+        for c in ('cancer_history', 'kidney_disease', 'liver_disease'): np.add(o, f[c], out=o, where=~np.isnan(f[c]))
+        # 3. Age interactions
+        np.multiply(age, chronic, out=f['age_chronic_interaction'])
+        np.multiply(age, risk, out=f['age_risk_score'])
+        f['elderly_chronic'][:] = (age > 65) & (chronic >= 2)
+        f['young_high_risk'][:] = (age < 40) & (chronic >= 1)
+        # 4. Income & insurance
+        o = f['premium_burden']; np.add(income, 1, out=o); np.divide(premium, o, out=o)
+        o = f['deductible_to_income']; np.add(income, 1, out=o); np.divide(ded, o, out=o)
+        np.add(ded, copay, out=f['out_of_pocket_risk'])
+        o = f['coverage_adequacy']; np.add(f['out_of_pocket_risk'], 1, out=o); np.divide(income, o, out=o)
+        # 5. Lifestyle
+        f['is_obese'][:] = bmi >= 30
+        f['is_overweight'][:] = bmi >= 25
+        f['smoker_numeric'][:] = self._categories(data, 'smoker', n)
+        o = f['lifestyle_risk_score']; np.multiply(f['smoker_numeric'], 3, out=o); o += 2 * f['is_obese']
+        # 6. Clinical
+        o = f['bp_ratio']; np.add(dbp, 1, out=o); np.divide(sbp, o, out=o)
+        np.subtract(sbp, dbp, out=f['pulse_pressure'])
+        f['hypertensive'][:] = (sbp > 140) | (dbp > 90)
+        f['high_cholesterol'][:] = f['ldl'] > 130
+        f['diabetic_control'][:] = f['hba1c'] > 6.5
+        np.divide(claims, 12, out=f['claims_frequency'])
+        # 8. Demographics
+        f['education_level'][:] = self._categories(data, 'education', n)
+        employment = self._categories(data, 'employment_status', n)
+        f['is_employed'][:], f['is_retired'][:] = employment[:, 0], employment[:, 1]
+        f['is_urban'][:] = self._categories(data, 'urban_rural', n)
+        f['gender_encoded'][:] = self._categories(data, 'sex', n)
+        # 9. Household
+        o = f['household_per_capita_income']; np.add(hh, 1, out=o); np.divide(income, o, out=o)
+        o = f['dependents_ratio']; np.add(hh, 1, out=o); np.divide(dep, o, out=o)
+        f['has_dependents'][:] = dep > 0
+        f['large_family'][:] = hh >= 4
+        # 10-11. Polynomial and log terms
+        for name, v in (('age', age), ('bmi', bmi), ('chronic', chronic), ('visits', visits), ('income', income)):
+            np.square(v, out=f[f'{name}_squared'])
+        for name, v in (('income', income), ('premium', premium), ('claims', paid), ('visits', visits)):
+            np.log1p(v, out=f[f'log_{name}'])
+        # 12-16. Policy, mental health, region, network, claims
+        f['policy_stability'][:] = f['policy_term_years'] > 2
+        f['frequent_policy_changes'][:] = f['policy_changes_last_2yrs'] >= 2
+        f['high_deductible'][:] = ded > t['high_deductible']
+        f['mental_health_concern'][:] = f['mental_health'] == 1
+        i = self._pos[f'region_{NOTEBOOK_REGIONS[0]}']
+        X[:, i:i + len(NOTEBOOK_REGIONS)] = self._categories(data, 'region', n)
+        f['premium_network'][:] = self._categories(data, 'network_tier', n)
+        f['high_quality_provider'][:] = f['provider_quality'] > t['high_quality_provider']
+        o = f['claims_to_premium_ratio']; np.add(premium, 1, out=o); np.divide(paid, o, out=o)
+        f['high_claims_user'][:] = claims > t['high_claims_user']
+
+        if self.means is not None:
+            missing = np.isnan(X)
+            if missing.any(): np.copyto(X, self.means, where=missing)
+        return X
+
+
+# ==========================================
+# 3. PARITY CHECK + TIMINGS (python -m features)
+# ==========================================
+NOTEBOOK = 'health-cost-prediction-cinematic.ipynb'
+
+
+def notebook_reference(df, notebook=NOTEBOOK):
+    """Run the notebook's own feature cell on `df`: its matrix in NOTEBOOK_FEATURES order, NaNs filled as it did."""
+    import contextlib
+    import io
+    import json
+    with open(notebook, encoding='utf-8') as f: cells = json.load(f)['cells']
+    src = next(''.join(c['source']) for c in cells
+               if c['cell_type'] == 'code' and 'FEATURE ENGINEERING IN PROGRESS' in ''.join(c['source']))
+    # The notebook ran on object-dtype strings (pandas < 3), which its smoker mapping depends on
+    df = df.astype({c: object for c in df.columns if not pd.api.types.is_numeric_dtype(df[c])})
+    ns = {'df': df, 'pd': pd, 'np': np}
+    with contextlib.redirect_stdout(io.StringIO()): exec(src, ns)
+    X = ns['df_fe'][NOTEBOOK_FEATURES]
+    return X.fillna(X.mean())
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    import time
+    p = argparse.ArgumentParser(prog='features', description="Check the notebook feature pipeline against the notebook's own cell and time it.")
+    p.add_argument('--source', default='medical_insurance.csv')
+    p.add_argument('--notebook', default=NOTEBOOK)
+    p.add_argument('--single', type=int, default=1000, help="Rows also encoded one profile at a time")
+    args = p.parse_args(argv)
+
+    def timed(fn):
+        t0 = time.perf_counter()
+        out = fn()
+        return out, time.perf_counter() - t0
+
+    df = pd.read_csv(args.source)
+    enc, fit_s = timed(lambda: NotebookEncoder.fit(df))
+    X, batch_s = timed(lambda: enc.transform(df))
+    ref, ref_s = timed(lambda: notebook_reference(df, args.notebook).to_numpy(np.float64))
+    rows = df.head(args.single).to_dict('records')
+    single, single_s = timed(lambda: np.vstack([enc.transform(r) for r in rows]))
+
+    err = np.abs(X - ref) / np.maximum(1, np.abs(ref))
+    worst = int(np.argmax(err.max(axis=0)))
+    single_err = float(np.max(np.abs(single - X[:len(rows)]), initial=0))
+    print(f"{len(df):,} rows x {len(enc.features)} features")
+    print(f"  fit          {fit_s * 1000:9.1f} ms")
+    print(f"  transform    {batch_s * 1000:9.1f} ms  ({len(df) / batch_s:,.0f} rows/s)")
+    print(f"  notebook     {ref_s * 1000:9.1f} ms  ({ref_s / batch_s:.1f}x slower)")
+    print(f"  single row   {single_s / max(len(rows), 1) * 1e6:9.1f} us")
+    print(f"  max relative difference vs notebook: {err.max():.2e} ({enc.features[worst]}); single vs batch: {single_err:.2e}")
+    if err.max() > 1e-12 or single_err: sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
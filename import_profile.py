@@ -0,0 +1,68 @@
+"""Import-time profile of the app's entry points (`python -X importtime`).
+
+    python -m import_profile                 # report per entry point + heaviest packages
+    python -m import_profile --check         # exit 1 when an entry point is over its budget
+    python -m import_profile --json out.json # machine-readable, for tracking over time
+
+Every measurement is a fresh interpreter (cold import, warm OS file cache); the
+best of --repeat runs is reported.
+"""
+import argparse
+import json
+import subprocess
+import sys
+from collections import defaultdict
+
+# label -> (import statement, budget in ms)
+TARGETS = {
+    'home': ('import utils', 900),
+    'prediction page': ('import utils; utils.MODEL_CHOICES; import plotly.graph_objects', 1600),
+    'dashboard pages': ('import utils; import datastore, aggregates, plotly.express', 1600),
+    'prediction service': ('import service', 900),
+}
+
+
+def profile(statement, repeat=3):
+    """{'total_ms', 'packages': {top-level package: ms}} for the fastest of `repeat` cold runs."""
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                             capture_output=True, text=True, check=True).stderr
+        packages = defaultdict(int)
+        for line in out.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line: continue
+            self_us, _, name = line[len('import time:'):].split('|')
+            packages[name.strip().split('.')[0]] += int(self_us)
+        total = sum(packages.values()) / 1000
+        if best is None or total < best['total_ms']:
+            best = {'total_ms': round(total, 1),
+                    'packages': {k: round(v / 1000, 1) for k, v in sorted(packages.items(), key=lambda kv: -kv[1])}}
+    return best
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog='import_profile', description="Import-time profile of the app's entry points.")
+    p.add_argument('targets', nargs='*', help=f"Subset of: {', '.join(TARGETS)}")
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--top', type=int, default=8, help="Heaviest packages listed per target")
+    p.add_argument('--json', help="Write the results to this path")
+    p.add_argument('--check', action='store_true', help="Exit 1 if any target exceeds its budget")
+    args = p.parse_args(argv)
+
+    results, over = {}, []
+    for label in args.targets or list(TARGETS):
+        statement, budget = TARGETS[label]
+        res = dict(profile(statement, args.repeat), statement=statement, budget_ms=budget)
+        results[label] = res
+        if res['total_ms'] > budget: over.append(label)
+        heavy = ', '.join(f"{k} {v:.0f}" for k, v in list(res['packages'].items())[:args.top])
+        flag = 'OVER BUDGET' if res['total_ms'] > budget else 'ok'
+        print(f"{label:20s} {res['total_ms']:7.0f} ms (budget {budget} ms, {flag})\n    {heavy}", file=sys.stderr)
+
+    if args.json:
+        with open(args.json, 'w') as f: json.dump(results, f, indent=2)
+    if args.check and over: sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
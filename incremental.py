@@ -0,0 +1,141 @@
+"""Apply new claim batches without a full reload or retrain.
+
+    python -m incremental incoming/
+
+Each *.csv in the directory is appended once to the columnar store, folded into
+the aggregate cube, and used to update the persisted models:
+
+- streamed linear models and KNN take the new rows exactly (every row seen so far);
+- boosted models (gradient boosting, histogram GB, XGBoost, LightGBM) fit a fixed
+  BOOST_STAGES more stages on the batch, which correct the model where it errs on
+  the new rows. Past MAX_BOOST_GROWTH over their trained size they are refitted;
+- averaging forests are refitted within the training time budget on the store,
+  which now includes the batch: trees grown on a few hundred rows would only add
+  noise to an average of trees grown on thousands;
+- the rest (decision tree, AdaBoost, SVR, lasso / elastic net) keep their version
+  until the next `python -m training` run.
+
+`training_rows` stays the rows of the last full fit; rows only seen by added
+boosting stages are counted in `update_rows`.
+"""
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+
+from datastore import SOURCE_CSV, append_batch, data_version
+from aggregates import update_cube
+from registry import ModelRegistry, is_servable
+from training import update_streaming, train_model, load_training_data
+from intervals import calibrate
+
+INCOMING_DIR = 'incoming'
+TARGET = 'annual_medical_cost'
+BOOST_STAGES = 10       # Stages a boosted model fits on each batch (a fixed step: the model grows linearly)...
+MAX_BOOST_GROWTH = 0.5  # ...until it is this much larger than when fully trained; then it is refitted
+REFIT_MODELS = {'RandomForestRegressor', 'ExtraTreesRegressor'}
+
+
+def _stages(model):
+    kind = type(model).__name__
+    if kind == 'XGBRegressor': return model.get_booster().num_boosted_rounds()
+    if kind == 'LGBMRegressor': return model.booster_.num_trees()
+    if kind == 'HistGradientBoostingRegressor': return model.n_iter_
+    return len(model.estimators_)
+
+
+def _boost(model, X, y):
+    # Continue training from the fitted stages: only BOOST_STAGES new ones are fitted on the batch
+    kind = type(model).__name__
+    if kind == 'XGBRegressor':
+        model.set_params(n_estimators=BOOST_STAGES)
+        model.fit(X, y, xgb_model=model.get_booster())
+    elif kind == 'LGBMRegressor':
+        model.set_params(n_estimators=BOOST_STAGES)
+        model.fit(X, y, init_model=model.booster_)
+    elif kind == 'HistGradientBoostingRegressor':
+        model.set_params(warm_start=True, max_iter=model.n_iter_ + BOOST_STAGES)
+        model.fit(X, y)
+    else:
+        model.set_params(warm_start=True, n_estimators=len(model.estimators_) + BOOST_STAGES)
+        model.fit(X, y)
+
+
+def update_model(model, X, y):
+    """Update a fitted model in place on new rows. False if it can't (or should be refitted instead)."""
+    if hasattr(model, 'custom_scaler'): X = model.custom_scaler.transform(X)
+    if hasattr(model, 'sufficient_stats'):
+        # Streamed linear models: exact refit from stored statistics + the new rows
+        update_streaming(model, X, y)
+        return True
+    if type(model).__name__ == 'KNeighborsRegressor':
+        # KNN "training" is its point set: append the batch (the index is rebuilt on save)
+        model.fit(np.vstack([model._fit_X, X]), np.concatenate([model._y, y]))
+        model.training_rows = len(model._y)
+        return True
+    if hasattr(model, 'partial_fit'):
+        model.partial_fit(X, y)
+        model.training_rows = getattr(model, 'training_rows', 0) + len(X)
+        return True
+    if type(model).__name__ in {'GradientBoostingRegressor', 'HistGradientBoostingRegressor', 'XGBRegressor', 'LGBMRegressor'}:
+        if not hasattr(model, 'trained_stages'): model.trained_stages = _stages(model)
+        if _stages(model) + BOOST_STAGES > model.trained_stages * (1 + MAX_BOOST_GROWTH): return False
+        _boost(model, X, y)
+        model.update_rows = getattr(model, 'update_rows', 0) + len(X)
+        return True
+    return False
+
+
+def apply_batch(path, source=SOURCE_CSV, registry=None):
+    """Append one batch; returns (rows appended, names of models updated) or None if already applied."""
+    registry = registry or ModelRegistry()
+    prev = data_version(source)
+    batch = append_batch(path, source)
+    if batch is None: return None
+    update_cube(batch, prev, source)
+
+    updated, data = [], None
+    for name in registry.live_models():
+        hit = registry.load_writable(name, servable=is_servable)
+        if not hit: continue
+        model, features = hit
+        enc = model.feature_encoder
+        rows = batch.dropna(subset=[c for c in ['age', 'bmi', 'sex', 'smoker', 'region', enc.dep_col, TARGET] if c in batch.columns])
+        if rows.empty: continue
+        X, y = enc.transform(rows), rows[TARGET].to_numpy()
+        # The current version has not seen this batch: its scores join the calibration set
+        calibration = calibrate(model, X, y, previous=getattr(model, 'calibration', None))
+        if update_model(model, X, y):
+            if calibration is not None: model.calibration = calibration
+        elif type(model).__name__ in REFIT_MODELS or hasattr(model, 'trained_stages'):
+            data = data or load_training_data(source)  # Read once for every model refitted on this batch
+            model = train_model(name, source, data=data)  # Calibrated on its own held-out rows
+        else: continue
+        registry.save(name, model, features)
+        updated.append(name)
+    return len(batch), updated
+
+
+def ingest_pending(directory=INCOMING_DIR, source=SOURCE_CSV, registry=None):
+    results, registry = {}, registry or ModelRegistry()
+    for path in sorted(glob.glob(os.path.join(directory, '*.csv'))):
+        res = apply_batch(path, source, registry)
+        if res is not None: results[os.path.basename(path)] = res
+    return results
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog='incremental', description="Append new claim batches to the store, cube and models.")
+    p.add_argument('directory', nargs='?', default=INCOMING_DIR)
+    args = p.parse_args(argv)
+
+    results = ingest_pending(args.directory)
+    for name, (rows, models) in results.items():
+        print(f"{name}: +{rows:,} rows; updated {', '.join(models) or 'no models'}", file=sys.stderr)
+    if not results: print(f"No new batches in {args.directory}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Prediction intervals from the same pass as the point estimate.
+
+Averaging forests (random forest, extra trees) get conformalized quantile intervals:
+the spread of their per-tree outputs, which the flat tree walk computes anyway, gives
+each row its own band, and a margin calibrated on held-out rows widens it to the
+nominal coverage. Every other model gets split-conformal intervals: the point estimate
++- a calibrated residual quantile.
+
+The margins (one per level in LEVELS) are stored on the model as `model.calibration`,
+so every saved model version carries its own. A model without one (e.g. the notebook
+artifacts) gets NaN bounds. The calibration also keeps its conformity scores (the most
+recent MAX_CALIBRATION_ROWS), so a new batch's scores are merged into them rather
+than replacing them.
+"""
+import numpy as np
+
+LEVELS = (0.5, 0.8, 0.9, 0.95)
+DEFAULT_LEVEL = 0.9
+CALIBRATION_ROWS = 2000        # Always held out of the fit...
+MAX_CALIBRATION_ROWS = 10_000  # ...plus the rows a time-budgeted fit left unused, up to this many (and the scores kept)
+MIN_CALIBRATION_ROWS = 100     # Below this the margins would be noise: keep the previous ones
+FORESTS = {'RandomForestRegressor', 'ExtraTreesRegressor'}
+
+
+def tree_outputs(model, X):
+    """(prediction, per-tree outputs) of an averaging forest from one walk; None for other models."""
+    engine = getattr(model, 'flat_engine', None)
+    if engine is not None and engine.divisor > 1: return engine.predict(X, per_tree=True)
+    if type(model).__name__ not in FORESTS: return None
+    per_tree = np.column_stack([e.predict(X) for e in model.estimators_])
+    # Summed tree by tree, then divided: the same rounding as the forest's own predict
+    pred = np.zeros(len(per_tree))
+    for col in per_tree.T: pred += col
+    return pred / len(model.estimators_), per_tree
+
+
+def _band(per_tree, level):
+    a = (1 - level) / 2
+    return np.quantile(per_tree, [a, 1 - a], axis=1)
+
+
+def calibrate(model, X, y, levels=LEVELS, previous=None):
+    """Margins per level from held-out encoded rows X (before the model's scaler) and targets y.
+
+    With a `previous` calibration of the same kind, its scores are merged with the new
+    ones (oldest dropped past MAX_CALIBRATION_ROWS): a small batch refines the margins
+    instead of deciding them alone.
+    """
+    if hasattr(model, 'custom_scaler'): X = model.custom_scaler.transform(X)
+    y = np.asarray(y, dtype=np.float64)
+    out = tree_outputs(model, X)
+    method = 'residual' if out is None else 'quantile'
+    if out is None:
+        scores = np.tile(np.abs(y - model.predict(X)), (len(levels), 1))
+    else:
+        scores = np.empty((len(levels), len(y)))
+        for i, level in enumerate(levels):
+            lo, hi = _band(out[1], level)
+            scores[i] = np.maximum(lo - y, y - hi)
+    if previous and 'scores' in previous and previous['method'] == method and previous['levels'] == list(levels):
+        scores = np.hstack([previous['scores'], scores])[:, -MAX_CALIBRATION_ROWS:]
+    n = scores.shape[1]
+    if n < MIN_CALIBRATION_ROWS: return None
+    # Finite-sample conformal quantile: the ceil((n + 1) * level)-th smallest score
+    ks = [min(int(np.ceil((n + 1) * level)), n) for level in levels]
+    margins = [float(np.partition(row, k - 1)[k - 1]) for row, k in zip(scores, ks)]
+    return {'method': method, 'levels': list(levels), 'margins': margins, 'rows': n, 'scores': scores.astype(np.float32)}
+
+
+def interval(model, X, level=DEFAULT_LEVEL, predict=None):
+    """(prediction, lower, upper) for model-input rows X, from one pass over the model."""
+    out = tree_outputs(model, X)
+    pred = out[0] if out is not None else (predict or model.predict)(X)
+    cal = getattr(model, 'calibration', None)
+    if cal is None: return pred, np.full(len(pred), np.nan), np.full(len(pred), np.nan)
+    if level not in cal['levels']: raise ValueError(f"Interval level {level} is not calibrated (have {cal['levels']})")
+    margin = cal['margins'][cal['levels'].index(level)]
+    if cal['method'] == 'quantile' and out is not None:
+        lo, hi = _band(out[1], level)
+        return pred, np.minimum(lo - margin, pred), np.maximum(hi + margin, pred)
+    return pred, pred - margin, pred + margin
@@ -0,0 +1,162 @@
+"""Persisted spatial index for the K-Nearest Neighbors model.
+
+    python -m knn_index                   # build + check the index of the registry's KNN model
+
+The index is the KD-tree the fitted model already holds over its scaled training
+points (`_tree`, which shares `_fit_X`'s memory), together with its targets. Only the
+index's metadata is saved next to the model: the tree and targets come from the
+model file, which joblib memory-maps on load (worker processes share the pages
+instead of each rebuilding or copying them). A query descends the tree
+(logarithmic in the training rows for this low-dimensional feature space, where a
+brute-force scan is linear) and skips KNeighborsRegressor.predict's per-call setup.
+Since it is the model's own tree, equidistant neighbours break ties as the model does.
+
+Each export is checked against an exact brute-force search before it is saved:
+recall@k on probe rows must reach MIN_RECALL and the predictions must match the
+model's own. The registry attaches the index to the model and predict_batch uses it.
+"""
+import argparse
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+
+INDEX_VERSION = 2
+MIN_RECALL = 0.999
+PROBE_ROWS = 500
+
+
+class NeighborIndex:
+    """KD-tree + training targets: the whole of a fitted KNeighborsRegressor's predict."""
+
+    def __init__(self, tree, y, k, weights='uniform', meta=None):
+        self.tree, self.y, self.k, self.weights = tree, y, int(k), weights
+        self.meta = meta or {}
+
+    @property
+    def n_rows(self):
+        return len(self.y)
+
+    def query(self, X):
+        """(distances, row indices) of the k nearest training points, nearest first."""
+        return self.tree.query(np.asarray(X, dtype=np.float64), k=self.k)
+
+    def predict(self, X):
+        dist, idx = self.query(X)
+        y = self.y[idx]
+        if self.weights != 'distance': return y.mean(axis=1)
+        # Inverse-distance weights; an exact match takes all the weight (as in scikit-learn)
+        with np.errstate(divide='ignore'): w = 1.0 / dist
+        hit = np.isinf(w)
+        exact = hit.any(axis=1)
+        w[exact] = hit[exact]
+        return (y * w).sum(axis=1) / w.sum(axis=1)
+
+    # --- persistence -----------------------------------------------------
+    def __getstate__(self):
+        # The tree and targets belong to the model and are saved (and memory-mapped) with it
+        return dict(self.__dict__, tree=None, y=None)
+
+    def save(self, path):
+        self.meta = dict(self.meta, index_version=INDEX_VERSION)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        joblib.dump(self, tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, model):
+        """The saved index of `model`, bound to the model's own tree and targets; None if stale."""
+        index = joblib.load(path)
+        if not isinstance(index, cls) or index.meta.get('index_version') != INDEX_VERSION: return None
+        if getattr(model, '_fit_method', None) != 'kd_tree': return None
+        index.tree, index.y = model._tree, np.asarray(model._y, dtype=np.float64)
+        return index
+
+
+# ==========================================
+# 1. EXACT REFERENCE + RECALL
+# ==========================================
+def exact_kth_distance(data, X, k, chunk=256):
+    """Squared distance from each row of X to its k-th nearest row of `data` (brute force)."""
+    sq = np.einsum('ij,ij->i', data, data)
+    out = []
+    for i in range(0, len(X), chunk):
+        q = X[i:i + chunk]
+        d = sq[None, :] - 2 * q @ data.T + np.einsum('ij,ij->i', q, q)[:, None]
+        out.append(np.partition(d, k - 1, axis=1)[:, k - 1])
+    return np.concatenate(out)
+
+
+def recall(index, data, X):
+    """Fraction of the true k nearest neighbours the index returns (ties count as found)."""
+    dist, _ = index.query(X)
+    kth = exact_kth_distance(data, X, index.k)
+    found = (dist ** 2 <= kth[:, None] * (1 + 1e-9) + 1e-9).sum(axis=1)
+    return float(np.minimum(found, index.k).mean() / index.k)
+
+
+def probe_rows(data, n=PROBE_ROWS, seed=0):
+    """Training points with a little noise (the neighbourhoods real queries land in), plus exact ties:
+    training points themselves (duplicated profiles are common) and midpoints of two training points."""
+    rng = np.random.default_rng(seed)
+    rows = data[rng.choice(len(data), min(n, len(data)), replace=False)]
+    pairs = data[rng.choice(len(data), (min(n, len(data)) // 2, 2))]
+    return np.vstack([rows + rng.normal(scale=0.05, size=rows.shape), rows, pairs.mean(axis=1)])
+
+
+# ==========================================
+# 2. BUILD + EXPORT
+# ==========================================
+def build(model):
+    """NeighborIndex over a fitted KNeighborsRegressor's own KD-tree, or None."""
+    if type(model).__name__ != 'KNeighborsRegressor': return None
+    if model.weights not in ('uniform', 'distance') or model.effective_metric_ != 'euclidean': return None
+    if getattr(model, '_fit_method', None) != 'kd_tree': return None  # Brute-force / ball-tree searches: no KD-tree to reuse
+    return NeighborIndex(model._tree, np.asarray(model._y, dtype=np.float64), model.n_neighbors, model.weights)
+
+
+def export(model, path, meta=None):
+    """Build, check against exact search and save the index of `model`; None if unsupported / failed."""
+    try: index = build(model)
+    except Exception: return None
+    if index is None: return None
+    data = np.asarray(model._fit_X, dtype=np.float64)
+    X = probe_rows(data)
+    r = recall(index, data, X)
+    if r < MIN_RECALL or not np.allclose(index.predict(X), model.predict(X)): return None
+    index.meta = dict(meta or {}, recall=r, model_version=getattr(model, 'model_version', None),
+                      model_type=type(model).__name__)
+    index.save(path)
+    return index
+
+
+def main(argv=None):
+    from registry import ModelRegistry
+    p = argparse.ArgumentParser(prog='knn_index', description="Build and check the KNN model's spatial index.")
+    p.add_argument('--model', default="K-Nearest Neighbors")
+    args = p.parse_args(argv)
+
+    reg = ModelRegistry()
+    hit = reg.load(args.model)
+    if not hit: sys.exit(f"{args.model}: no persisted model")
+    model, _ = hit
+    index = reg.export_index(args.model, model)
+    if index is None: sys.exit(f"{args.model}: not indexable")
+    data = np.asarray(model._fit_X, dtype=np.float64)
+    X = probe_rows(data, 1000, seed=1)
+    for n in (1, len(X)):
+        ref = min(_time(model.predict, X[:n]) for _ in range(5))
+        fast = min(_time(index.predict, X[:n]) for _ in range(5))
+        print(f"{n:5d} rows: {ref * 1e3:.2f} ms -> {fast * 1e3:.2f} ms ({ref / fast:.1f}x)", file=sys.stderr)
+    print(f"{args.model}: {index.n_rows:,} training rows, k={index.k}, recall@k {index.meta['recall']:.4f}",
+          file=sys.stderr)
+
+
+def _time(fn, X):
+    t0 = time.perf_counter(); fn(X); return time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""In-process timing spans, counters and gauges, exported as Prometheus / OpenMetrics text.
+
+    with span('inference'): ...          # step latency histogram (+ the current page run's breakdown)
+    METRICS.cache_request('dataset')      # on every call of a cached loader...
+    METRICS.cache_miss('dataset')         # ...and inside its body, which only runs on a miss
+
+Stdlib only and cheap to import (the Home page imports it). A span costs a couple of
+microseconds. Set METRICS_FILE to have each page run rewrite a Prometheus textfile
+(at most every METRICS_FILE_INTERVAL_S); the prediction service serves GET /metrics.
+"""
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RUN_HISTORY = 50  # Recent page runs kept for per-request breakdowns
+METRICS_FILE = os.environ.get('METRICS_FILE')
+METRICS_FILE_INTERVAL_S = float(os.environ.get('METRICS_FILE_INTERVAL_S', 15))
+PREFIX = 'app_'
+
+_RUN = contextvars.ContextVar('metrics_run', default=None)
+_DEPTH = contextvars.ContextVar('metrics_depth', default=())
+
+
+def rss_bytes():
+    """Resident set size of this process (peak RSS where /proc is unavailable), or None."""
+    try:
+        with open('/proc/self/statm') as f: return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        try: import resource
+        except ImportError: return None
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def _labels(labels):
+    if not labels: return ''
+    esc = lambda v: str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{' + ','.join(f'{k}="{esc(v)}"' for k, v in labels) + '}'
+
+
+# ==========================================
+# 1. SPANS
+# ==========================================
+class Span:
+    """Times its `with` block into the step histogram; nested spans show up as parent/child in page runs."""
+    __slots__ = ('metrics', 'name', 't0', 'token')
+
+    def __init__(self, metrics, name):
+        self.metrics, self.name = metrics, name
+
+    def __enter__(self):
+        self.token = _DEPTH.set(_DEPTH.get() + (self.name,))
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.t0
+        path = _DEPTH.get()
+        _DEPTH.reset(self.token)
+        self.metrics.observe(self.name, seconds)
+        run = _RUN.get()
+        if run is not None: run['steps'].append(('/'.join(path), seconds, len(path) - 1))
+        return False
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count', 'max')
+
+    def __init__(self):
+        self.counts, self.sum, self.count, self.max = [0] * (len(BUCKETS) + 1), 0.0, 0, 0.0
+
+    def observe(self, v):
+        i = 0
+        while i < len(BUCKETS) and v > BUCKETS[i]: i += 1
+        self.counts[i] += 1; self.sum += v; self.count += 1
+        if v > self.max: self.max = v
+
+
+# ==========================================
+# 2. REGISTRY
+# ==========================================
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.steps = {}      # step -> Histogram
+        self.counters = {}   # (name, labels) -> value
+        self.gauges = {}     # (name, labels) -> zero-argument callable
+        self.runs = deque(maxlen=RUN_HISTORY)
+        self.started = time.time()
+        self._written = 0.0
+
+    def span(self, name):
+        return Span(self, name)
+
+    def observe(self, step, seconds):
+        with self._lock:
+            h = self.steps.get(step)
+            if h is None: h = self.steps[step] = Histogram()
+            h.observe(seconds)
+
+    def inc(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock: self.counters[key] = self.counters.get(key, 0) + n
+
+    def gauge(self, name, fn, **labels):
+        """Register `fn()` as a gauge, read at export time."""
+        self.gauges[(name, tuple(sorted(labels.items())))] = fn
+
+    def cache_request(self, cache): self.inc('cache_requests', cache=cache)
+    def cache_miss(self, cache): self.inc('cache_misses', cache=cache)
+
+    def step_stats(self):
+        """step -> (calls, total seconds, max seconds)."""
+        with self._lock: return {k: (h.count, h.sum, h.max) for k, h in self.steps.items()}
+
+    def recent_runs(self):
+        """Finished or other sessions' page runs, oldest first: {'page', 'started', 'steps': [(path, seconds, depth)]}."""
+        current = _RUN.get()
+        with self._lock: return [dict(r, steps=list(r['steps'])) for r in self.runs if r is not current]
+
+    def cache_stats(self):
+        """cache -> (requests, misses, hit ratio)."""
+        out = {}
+        for (name, labels), v in list(self.counters.items()):
+            if name != 'cache_requests': continue
+            misses = self.counters.get(('cache_misses', labels), 0)
+            out[dict(labels)['cache']] = (v, misses, 1 - misses / v if v else 0.0)
+        return out
+
+    # --- page runs (one per Streamlit script run) --------------------------
+    def begin_run(self, page):
+        run = {'page': page, 'started': time.time(), 'steps': []}
+        with self._lock: self.runs.append(run)
+        _RUN.set(run)
+        self.inc('page_runs', page=page)
+        if METRICS_FILE and time.time() - self._written > METRICS_FILE_INTERVAL_S: self.write(METRICS_FILE)
+        return run
+
+    # --- export --------------------------------------------------------------
+    def render(self, openmetrics=False):
+        """Prometheus text exposition format (0.0.4), or OpenMetrics 1.0 with `openmetrics`."""
+        out = []
+        def family(name, kind, help_):
+            base = name[:-len('_total')] if openmetrics and kind == 'counter' else name
+            out.append(f'# HELP {base} {help_}'); out.append(f'# TYPE {base} {kind}')
+
+        with self._lock:
+            steps = {k: (list(h.counts), h.sum, h.count) for k, h in self.steps.items()}
+            counters = dict(self.counters)
+        name = f'{PREFIX}step_seconds'
+        family(name, 'histogram', 'Time spent per instrumented step.')
+        for step, (counts, total, n) in sorted(steps.items()):
+            cum = 0
+            for le, c in zip(list(BUCKETS) + ['+Inf'], counts):
+                cum += c
+                out.append(f'{name}_bucket{_labels([("step", step), ("le", le)])} {cum}')
+            out.append(f'{name}_sum{_labels([("step", step)])} {total}')
+            out.append(f'{name}_count{_labels([("step", step)])} {n}')
+        for metric in sorted({k[0] for k in counters}):
+            name = f'{PREFIX}{metric}_total'
+            family(name, 'counter', f'Count of {metric.replace("_", " ")}.')
+            for (m, labels), v in sorted(counters.items()):
+                if m == metric: out.append(f'{name}{_labels(labels)} {v}')
+        gauges = sorted(self.gauges.items(), key=lambda kv: kv[0])
+        for metric in sorted({k[0] for k, _ in gauges}):
+            family(f'{PREFIX}{metric}', 'gauge', f'{metric.replace("_", " ").capitalize()}.')
+            for (m, labels), fn in gauges:
+                if m != metric: continue
+                try: out.append(f'{PREFIX}{metric}{_labels(labels)} {float(fn())}')
+                except Exception: pass  # A broken gauge must not break the export
+
+        rss, cpu = rss_bytes(), os.times()
+        if rss is not None:
+            family('process_resident_memory_bytes', 'gauge', 'Resident memory size in bytes.')
+            out.append(f'process_resident_memory_bytes {rss}')
+        family('process_cpu_seconds_total', 'counter', 'Total user and system CPU time spent in seconds.')
+        out.append(f'process_cpu_seconds_total {cpu.user + cpu.system}')
+        family('process_start_time_seconds', 'gauge', 'Start time of the process since unix epoch in seconds.')
+        out.append(f'process_start_time_seconds {self.started}')
+        if openmetrics: out.append('# EOF')
+        return '\n'.join(out) + '\n'
+
+    def write(self, path, openmetrics=False):
+        # Atomic replace, so a textfile collector never reads half a file
+        self._written = time.time()
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f: f.write(self.render(openmetrics))
+        os.replace(tmp, path)
+
+
+METRICS = Metrics()
+span = METRICS.span
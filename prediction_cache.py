@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 1. CANONICAL PROFILES
+# ==========================================
+# The UI can only produce a small set of profiles (integer age, BMI on a 0.1 slider,
+# tiny enumerations), so quantized profiles repeat heavily across users and reruns.
+PROFILE_FIELDS = ['age', 'bmi', 'sex', 'smoker', 'region', 'dependents']
+BMI_DECIMALS = 1
+SMOKER_LABELS = {True: 'Current', False: 'Never'}
+
+
+def canonical(profile):
+    """Hashable, quantized form of one input profile (the cache key and the row that is scored)."""
+    smoker = profile.get('smoker', False)
+    if isinstance(smoker, (bool, np.bool_)): smoker = SMOKER_LABELS[bool(smoker)]
+    dependents = profile.get('dependents', profile.get('children', 0))
+    return (int(profile['age']), round(float(profile['bmi']), BMI_DECIMALS), str(profile.get('sex', '')),
+            str(smoker), str(profile.get('region', '')), int(dependents))
+
+
+def profile_grid(ages=range(18, 91), bmis=(22.0, 28.5), sexes=('Male', 'Female'), smokers=(False, True),
+                 regions=('North', 'South', 'East', 'West'), dependents=range(0, 6)):
+    """Common profiles for pre-warming: every enumeration at the default and 'optimal' BMI."""
+    idx = pd.MultiIndex.from_product([ages, bmis, sexes, smokers, regions, dependents], names=PROFILE_FIELDS)
+    return idx.to_frame(index=False)
+
+
+# ==========================================
+# 2. LRU / TTL CACHE
+# ==========================================
+class PredictionCache:
+    """Thread-safe LRU + TTL cache of model outputs keyed by (model, version, profile).
+
+    One instance is shared by every session of the app process; the model version
+    in the key means a retrained / incrementally updated model never serves stale
+    predictions, while TTL bounds how long an unused entry survives.
+    """
+
+    def __init__(self, maxsize=200_000, ttl=3600):
+        self.maxsize, self.ttl = maxsize, ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        self.warmed = set()
+
+    def get_many(self, keys):
+        """Cached values (None where missing/expired), refreshing recency for hits."""
+        now, out = time.monotonic(), []
+        with self._lock:
+            for k in keys:
+                hit = self._data.get(k)
+                if hit is not None and (self.ttl is None or now - hit[1] <= self.ttl):
+                    self._data.move_to_end(k)
+                    out.append(hit[0])
+                    self.hits += 1
+                else:
+                    if hit is not None: del self._data[k]
+                    out.append(None)
+                    self.misses += 1
+        return out
+
+    def put_many(self, keys, values):
+        now = time.monotonic()
+        with self._lock:
+            for k, v in zip(keys, values):
+                self._data[k] = (v, now)
+                self._data.move_to_end(k)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear(); self.warmed.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'entries': len(self._data), 'maxsize': self.maxsize, 'ttl': self.ttl, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions, 'hit_rate': self.hits / total if total else 0.0}
+
+
+def cached_predict(cache, model_key, profiles, predict):
+    """Predictions for `profiles` (list of dicts); only cache misses reach `predict`.
+
+    `model_key` identifies the model version, `predict(frame)` scores a DataFrame of
+    canonical profiles in one call: one value per row, or one row of values per
+    profile (e.g. prediction, lower, upper), which are cached together.
+    """
+    rows = [canonical(p) for p in profiles]
+    keys = [(model_key, r) for r in rows]
+    values = cache.get_many(keys)
+    missing = [i for i, v in enumerate(values) if v is None]
+    if missing:
+        # Score the quantized profile itself, so a cached value equals a fresh one
+        todo = list(dict.fromkeys(rows[i] for i in missing))
+        fresh = dict(zip(todo, _rows(predict(pd.DataFrame(todo, columns=PROFILE_FIELDS)))))
+        cache.put_many([(model_key, r) for r in todo], [fresh[r] for r in todo])
+        for i in missing: values[i] = fresh[rows[i]]
+    return np.asarray(values, dtype=np.float64)
+
+
+def _rows(preds):
+    # Cached form of each row's output: a float, or a tuple of floats
+    preds = np.asarray(preds, dtype=np.float64)
+    return [float(v) for v in preds] if preds.ndim == 1 else [tuple(map(float, v)) for v in preds]
+
+
+def warm(cache, model_key, predict, grid=None):
+    """Score the common profile grid in one batched call (once per model version)."""
+    if model_key in cache.warmed: return 0
+    grid = profile_grid() if grid is None else grid
+    rows = [canonical(p) for p in grid.to_dict('records')]
+    preds = predict(pd.DataFrame(rows, columns=PROFILE_FIELDS))
+    cache.put_many([(model_key, r) for r in rows], _rows(preds))
+    cache.warmed.add(model_key)
+    return len(rows)
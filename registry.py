@@ -0,0 +1,305 @@
+import os
+import json
+import pickle
+import joblib
+
+from features import FeatureEncoder, NotebookEncoder, NOTEBOOK_FEATURES, NOTEBOOK_INPUTS
+from metrics import span
+from tree_engine import FlatEnsemble, export
+import knn_index
+from intervals import interval
+
+# ==========================================
+# 1. ARTIFACT CATALOG
+# ==========================================
+MODEL_DIR = 'Trained_Models'
+LIVE_DIR = os.path.join(MODEL_DIR, 'live')
+
+# App model name -> artifact slug (Trained_Models/model_<slug>.pkl)
+MODEL_SLUGS = {
+    "Random Forest": "random_forest",
+    "Gradient Boosting": "gradient_boosting",
+    "Histogram Gradient Boosting": "hist_gradient_boosting",
+    "AdaBoost": "adaboost",
+    "Extra Trees": "extra_trees",
+    "Decision Tree": "decision_tree",
+    "Linear Regression": "linear_regression",
+    "Ridge Regression": "ridge",
+    "Lasso Regression": "lasso",
+    "ElasticNet": "elasticnet",
+    "K-Nearest Neighbors": "knn",
+    "Support Vector Machine (SVR)": "svr",
+    "XGBoost": "xgboost",
+    "LightGBM": "lightgbm",
+}
+
+# The notebook fitted these on scaler.pkl output
+SCALED_SLUGS = {"linear_regression", "ridge", "lasso", "elasticnet", "knn", "svr"}
+NOTEBOOK_ENCODER = 'notebook_encoder.pkl'  # Fitted notebook feature pipeline, kept in live/
+SOURCES = ('live', 'notebook')  # Artifact sources a caller can pin: live/ models or the notebook's pickles
+ATTACHED = ('flat_engine', 'neighbor_index')  # Saved separately, never pickled with the model
+
+
+def _n_features(obj):
+    n = getattr(obj, 'n_features_in_', None)
+    if n is None and hasattr(obj, 'custom_scaler'): n = getattr(obj.custom_scaler, 'n_features_in_', None)
+    return n
+
+
+def check_features(model, features):
+    """True when the fitted model expects exactly `features`, in order."""
+    n = _n_features(model)
+    if n is not None and n != len(features): return False
+    names = getattr(model, 'feature_names_in_', None)
+    if names is not None and list(names) != list(features): return False
+    return True
+
+
+# ==========================================
+# 2. REGISTRY
+# ==========================================
+class ModelRegistry:
+    """Lazily loads persisted models by app name.
+
+    Models persisted by live training / incremental updates under live/ are tried
+    first, then the notebook artifacts (model_<slug>.pkl + feature_columns.pkl +
+    scaler.pkl), which get the notebook's feature pipeline attached; `source=`
+    pins one of the two (SOURCES). Loads are
+    memory-mapped where joblib allows, and each model is loaded once per process
+    per version (live/versions.json).
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, live_dir=None):
+        self.model_dir = model_dir
+        self.live_dir = live_dir or os.path.join(model_dir, 'live')
+        self._models = {}
+        self._shared = {}
+        self._paths = {}
+        self._versions = (None, {})
+
+    def versions(self):
+        path = os.path.join(self.live_dir, 'versions.json')
+        try: mtime = os.stat(path).st_mtime_ns
+        except OSError: return {}
+        if self._versions[0] != mtime:
+            try:
+                with open(path) as f: self._versions = (mtime, json.load(f))
+            except (OSError, ValueError): return self._versions[1]
+        return self._versions[1]
+
+    def version(self, name):
+        """Monotonic version of the persisted model; 0 if it was never saved."""
+        return self.versions().get(MODEL_SLUGS.get(name), 0)
+
+    def _load(self, path):
+        if not os.path.exists(path): return None
+        try: return joblib.load(path, mmap_mode='r')
+        except Exception: return None  # Unreadable / incompatible pickle -> treat as missing
+
+    def _shared_artifact(self, fname):
+        if fname not in self._shared: self._shared[fname] = self._load(os.path.join(self.model_dir, fname))
+        return self._shared[fname]
+
+    def feature_columns(self):
+        cols = self._shared_artifact('feature_columns.pkl')
+        return list(cols) if cols is not None else None
+
+    def notebook_encoder(self):
+        """The notebook's feature pipeline, fitted once on the source CSV and persisted; None without data."""
+        if 'notebook_encoder' not in self._shared:
+            path = os.path.join(self.live_dir, NOTEBOOK_ENCODER)
+            enc = self._load(path)
+            if not isinstance(enc, NotebookEncoder) or enc.version != NotebookEncoder.VERSION:
+                import pandas as pd
+                from datastore import SOURCE_CSV
+                if not os.path.exists(SOURCE_CSV): return None
+                # The CSV, not the compacted store: thresholds must see the float64 values members send
+                enc = NotebookEncoder.fit(pd.read_csv(SOURCE_CSV, usecols=lambda c: c in NOTEBOOK_INPUTS))
+                try:
+                    os.makedirs(self.live_dir, exist_ok=True)
+                    tmp = f'{path}.{os.getpid()}.tmp'
+                    joblib.dump(enc, tmp)
+                    os.replace(tmp, path)
+                except OSError:
+                    pass
+            self._shared['notebook_encoder'] = enc
+        return self._shared['notebook_encoder']
+
+    def _candidates(self, slug, source=None):
+        if source not in (None,) + SOURCES: raise ValueError(f"Unknown model source: {source}")
+        # 1. Live-trained / updated artifact with its own feature sidecar
+        if source != 'notebook':
+            yield (os.path.join(self.live_dir, f'model_{slug}.pkl'), os.path.join(self.live_dir, f'feature_columns_{slug}.pkl'))
+        # 2. Notebook artifact
+        if source != 'live': yield (os.path.join(self.model_dir, f'model_{slug}.pkl'), None)
+
+    def available(self):
+        return [name for name, slug in MODEL_SLUGS.items()
+                if any(os.path.exists(p) for p, _ in self._candidates(slug))]
+
+    def load(self, name, servable=None, source=None):
+        """Return (model, feature_columns) or None if no valid artifact exists.
+
+        `servable(model, features)` lets the caller reject models it cannot encode for;
+        `source` ('live' / 'notebook') only considers that artifact.
+        """
+        slug = MODEL_SLUGS.get(name)
+        if slug is None: return None
+        version = self.version(name)
+        key = (slug, source)
+        if key in self._models and self._models[key][0] == version:
+            hit = self._models[key][1]
+            if servable is None or servable(*hit): return hit
+
+        for model_path, cols_path in self._candidates(slug, source):
+            model = self._load(model_path)
+            if model is None: continue
+            if cols_path is None:
+                features = self.feature_columns()
+                if features is None: continue
+                if slug in SCALED_SLUGS and not hasattr(model, 'custom_scaler'):
+                    scaler = self._shared_artifact('scaler.pkl')
+                    if scaler is None or not check_features(scaler, features): continue
+                    model.custom_scaler = scaler
+                if features == NOTEBOOK_FEATURES and getattr(model, 'feature_encoder', None) is None:
+                    encoder = self.notebook_encoder()
+                    if encoder is not None: model.feature_encoder = encoder
+            else:
+                features = self._load(cols_path)
+                if features is None: continue
+                features = list(features)
+            if not check_features(model, features): continue
+            if servable is not None and not servable(model, features): continue
+            self._paths[slug] = model_path
+            self._attach_engine(slug, model)
+            self._attach_index(slug, model)
+            self._models[key] = (version, (model, features))
+            return model, features
+        return None
+
+    def load_writable(self, name, servable=None):
+        """Like `load`, but a private copy to update: loaded models are read-only memory maps shared by the process."""
+        hit = self.load(name, servable)
+        if hit is None: return None
+        model, features = hit
+        attached = {k: model.__dict__.pop(k) for k in ATTACHED if k in model.__dict__}
+        try: return pickle.loads(pickle.dumps(model)), features
+        finally: model.__dict__.update(attached)
+
+    def save(self, name, model, features):
+        """Persist a live-trained / updated model and bump its version."""
+        slug = MODEL_SLUGS[name]
+        version = self.version(name) + 1
+        model.model_version = version
+        for attr in ATTACHED: model.__dict__.pop(attr, None)
+        try:
+            os.makedirs(self.live_dir, exist_ok=True)
+            joblib.dump(list(features), os.path.join(self.live_dir, f'feature_columns_{slug}.pkl'))
+            # Uncompressed so joblib can memory-map the arrays on load
+            tmp = os.path.join(self.live_dir, f'model_{slug}.pkl.{os.getpid()}.tmp')
+            joblib.dump(model, tmp)
+            os.replace(tmp, os.path.join(self.live_dir, f'model_{slug}.pkl'))
+            versions = dict(self.versions(), **{slug: version})
+            tmp = os.path.join(self.live_dir, f'versions.json.{os.getpid()}.tmp')
+            with open(tmp, 'w') as f: json.dump(versions, f)
+            os.replace(tmp, os.path.join(self.live_dir, 'versions.json'))
+        except OSError:
+            return False
+        self._paths[slug] = os.path.join(self.live_dir, f'model_{slug}.pkl')
+        self.export_engine(name, model)
+        self.export_index(name, model)
+        for source in (None, 'live'): self._models[(slug, source)] = (self.version(name), (model, list(features)))
+        return True
+
+    # --- flattened tree engines (tree_engine.py) ---------------------------
+    def _engine_path(self, slug):
+        return os.path.join(self.live_dir, f'engine_{slug}.npz')
+
+    def _source_mtime(self, slug):
+        try: return os.stat(self._paths[slug]).st_mtime_ns
+        except (KeyError, OSError): return None
+
+    def export_engine(self, name, model):
+        """Flatten + verify a tree model and attach it for serving; None if unsupported."""
+        slug = MODEL_SLUGS[name]
+        try:
+            os.makedirs(self.live_dir, exist_ok=True)
+            engine = export(model, self._engine_path(slug), meta={'source_mtime': self._source_mtime(slug)})
+        except OSError:
+            return None
+        if engine is not None: model.flat_engine = engine
+        return engine
+
+    def _attach_engine(self, slug, model):
+        self._attach(slug, model, 'flat_engine', self._engine_path(slug), FlatEnsemble.load)
+
+    # --- KNN spatial indexes (knn_index.py) ---------------------------------
+    def _index_path(self, slug):
+        return os.path.join(self.live_dir, f'index_{slug}.joblib')
+
+    def export_index(self, name, model):
+        """Build + recall-check a KNN model's KD-tree and attach it for serving; None if unsupported."""
+        slug = MODEL_SLUGS[name]
+        if type(model).__name__ != 'KNeighborsRegressor': return None
+        try:
+            os.makedirs(self.live_dir, exist_ok=True)
+            index = knn_index.export(model, self._index_path(slug), meta={'source_mtime': self._source_mtime(slug)})
+        except OSError:
+            return None
+        if index is not None: model.neighbor_index = index
+        return index
+
+    def _attach_index(self, slug, model):
+        self._attach(slug, model, 'neighbor_index', self._index_path(slug), lambda path: knn_index.NeighborIndex.load(path, model))
+
+    def _attach(self, slug, model, attr, path, load):
+        # Only an artifact built from exactly this model file and version is attached
+        if not os.path.exists(path): return
+        try: obj = load(path)
+        except Exception: return
+        if obj is None: return
+        meta = obj.meta
+        if (meta.get('model_type') == type(model).__name__ and meta.get('model_version') == getattr(model, 'model_version', None)
+                and meta.get('source_mtime') == self._source_mtime(slug)):
+            setattr(model, attr, obj)
+
+    def live_models(self):
+        """App names that have a live-trained artifact (candidates for incremental updates)."""
+        return [name for name, slug in MODEL_SLUGS.items()
+                if os.path.exists(os.path.join(self.live_dir, f'model_{slug}.pkl'))]
+
+
+# ==========================================
+# 3. SERVING (shared by the app, batch scoring and the HTTP service)
+# ==========================================
+def is_servable(model, features):
+    # Only models carrying the current version of their encoder can be served without train/serve skew
+    enc = getattr(model, 'feature_encoder', None)
+    return enc is not None and enc.version == type(enc).VERSION and enc.features == list(features)
+
+
+def serves_profiles(model, features):
+    # The app's pages collect the live profile fields only; the notebook layout needs full member rows
+    return is_servable(model, features) and isinstance(model.feature_encoder, FeatureEncoder)
+
+
+def _predict(model, X):
+    # Verified flattened tree walk (bit-identical to model.predict) for the batch sizes it wins
+    engine = getattr(model, 'flat_engine', None)
+    if engine is not None and len(X) <= (engine.max_rows or 0): return engine.predict(X)
+    # Memory-mapped KD-tree of a KNN model (recall-checked against exact search at export)
+    index = getattr(model, 'neighbor_index', None)
+    if index is not None: return index.predict(X)
+    return model.predict(X)
+
+
+def predict_batch(model, features, frame, level=None):
+    # One encode pass + one model.predict call for a dict, DataFrame, Arrow table or chunk;
+    # with a `level` (e.g. 0.9), (prediction, lower, upper) from that same call (intervals.py)
+    encoder = getattr(model, 'feature_encoder', None) or FeatureEncoder(dep_col=features[4])
+    with span('encode'):
+        X = encoder.transform(frame)
+        if hasattr(model, 'custom_scaler'): X = model.custom_scaler.transform(X)
+    with span('predict'):
+        if level is not None: return interval(model, X, level, lambda X: _predict(model, X))
+        return _predict(model, X)
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 1. SCENARIO GRIDS
+# ==========================================
+# A sweep is the cartesian product of perturbation axes around one member's
+# profile; every grid point (plus any named what-if scenarios) is scored in a
+# single batched model call and kept as an N-d cost surface.
+PROFILE_FIELDS = ['age', 'bmi', 'sex', 'smoker', 'region', 'dependents']
+OPTIMAL = {'bmi': 22.0, 'smoker': False}  # The "optimal health" comparison profile
+AGE_MAX = 90
+
+
+def default_axes(base, years=10):
+    """BMI range x smoking status x aging 0..`years` years x dependents."""
+    age = int(base['age'])
+    return {
+        'bmi': np.round(np.arange(16.0, 45.01, 0.5), 1),
+        'smoker': np.array([False, True]),
+        'age': np.arange(age, min(age + years, AGE_MAX) + 1),
+        'dependents': np.arange(0, 6),
+    }
+
+
+def _columns(base, axes, scenarios):
+    # Column arrays for grid rows followed by scenario rows (no per-row dicts)
+    mesh = np.meshgrid(*[np.asarray(v) for v in axes.values()], indexing='ij')
+    n_grid = mesh[0].size if mesh else 1
+    cols = {}
+    for field in PROFILE_FIELDS:
+        if field in axes: grid = mesh[list(axes).index(field)].ravel()
+        else: grid = np.full(n_grid, base.get(field), dtype=object if isinstance(base.get(field), str) else None)
+        extra = [s.get(field, base.get(field)) for s in scenarios.values()]
+        cols[field] = np.concatenate([grid.astype(object), np.array(extra, dtype=object)]) if extra else grid
+    # Numeric fields back to float so the encoder sees numbers, not objects
+    for field in ('age', 'bmi', 'dependents'): cols[field] = cols[field].astype(np.float64)
+    return cols, n_grid
+
+
+def sweep(predict, base, axes=None, scenarios=None):
+    """Score the grid of `axes` around `base` and the named `scenarios` in one `predict` call.
+
+    `predict(columns)` takes a column dict (as predict_batch does); 'current' (the
+    unchanged base profile) and 'optimal' are always among the scenarios.
+    """
+    axes = {k: np.asarray(v) for k, v in (axes if axes is not None else default_axes(base)).items()}
+    scenarios = dict({'current': {}, 'optimal': OPTIMAL}, **(scenarios or {}))
+    cols, n_grid = _columns(base, axes, scenarios)
+    costs = np.asarray(predict(cols), dtype=np.float64)
+    values = costs[:n_grid].reshape([len(v) for v in axes.values()])
+    return CostSurface(base, axes, values, dict(zip(scenarios, costs[n_grid:].tolist())))
+
+
+# ==========================================
+# 2. COST SURFACE
+# ==========================================
+class CostSurface:
+    """Predicted cost over a scenario grid, with 1-D / 2-D slices and marginal effects.
+
+    Axes not named in a query are held at the base profile's value (or the nearest
+    grid value to it).
+    """
+
+    def __init__(self, base, axes, values, scenarios):
+        self.base, self.axes, self.values, self.scenarios = base, axes, values, scenarios
+
+    @property
+    def gap(self):
+        """Premium of the current profile over the optimal-health profile."""
+        return self.scenarios['current'] - self.scenarios['optimal']
+
+    def _pos(self, axis, value):
+        vals = self.axes[axis]
+        if vals.dtype.kind in 'biuf': return int(np.abs(vals.astype(float) - float(value)).argmin())
+        hits = np.flatnonzero(vals == value)
+        return int(hits[0]) if len(hits) else 0
+
+    def _slice(self, keep, at):
+        index = []
+        for axis in self.axes:
+            if axis in keep: index.append(slice(None))
+            else: index.append(self._pos(axis, at.get(axis, self.base.get(axis))))
+        sub = self.values[tuple(index)]
+        # Order the kept axes as requested
+        order = [a for a in self.axes if a in keep]
+        return np.moveaxis(sub, [order.index(a) for a in keep], range(len(keep)))
+
+    def curve(self, axis, **at):
+        """1-D sensitivity curve: cost along `axis`."""
+        return pd.Series(self._slice([axis], at), index=pd.Index(self.axes[axis], name=axis), name='cost')
+
+    def grid(self, x, y, **at):
+        """2-D sensitivity surface: DataFrame indexed by `y`, columns `x`."""
+        return pd.DataFrame(self._slice([y, x], at), index=pd.Index(self.axes[y], name=y),
+                            columns=pd.Index(self.axes[x], name=x))
+
+    def marginal(self, axis, **at):
+        """Marginal effect along `axis`: d cost / d unit for numeric axes, cost minus the first level otherwise."""
+        c = self.curve(axis, **at)
+        vals = self.axes[axis]
+        if vals.dtype.kind in 'iuf' and len(vals) > 1:
+            return pd.Series(np.gradient(c.to_numpy(), vals.astype(float)), index=c.index, name='marginal')
+        return (c - c.iloc[0]).rename('marginal')
+
+    def effects(self, **at):
+        """Marginal effect of every axis at the base profile (one number per axis)."""
+        out = {}
+        for axis in self.axes:
+            m = self.marginal(axis, **at)
+            if self.axes[axis].dtype.kind in 'iuf': out[axis] = float(m.iloc[self._pos(axis, at.get(axis, self.base.get(axis)))])
+            else: out[axis] = float(m.iloc[-1])
+        return pd.Series(out, name='effect')
+
+    def frame(self):
+        """Long format: one row per grid point."""
+        idx = pd.MultiIndex.from_product(list(self.axes.values()), names=list(self.axes))
+        return pd.DataFrame({'cost': self.values.ravel()}, index=idx).reset_index()
@@ -0,0 +1,329 @@
+"""Headless prediction service (stdlib asyncio, no Streamlit).
+
+    python -m service --port 8765 --workers 2
+
+    POST /predict  {"model": "Random Forest", "profile": {...}}          -> {"prediction": ...}
+                   {"model": "Random Forest", "profiles": [{...}, ...]}  -> {"predictions": [...]}
+                   + "level": 0.9  -> also "lower" / "upper" (or lists of them), from the same call
+                   + "source": "notebook" | "live"  -> only that artifact (default: live, else notebook)
+    GET  /models   servable model names, versions and sources
+    GET  /stats    request counts, batch sizes and p50 / p99 latency (per worker)
+    GET  /metrics  step timings, counters and process RSS in Prometheus text format (per worker)
+    GET  /health
+
+Concurrent requests for the same model are micro-batched: whatever arrives within
+--max-wait-ms (up to --max-batch rows) is encoded and scored in one vectorized
+predict call, off the event loop. Models come from the same registry as the app
+(memory-mapped, so worker processes share the model pages).
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from datastore import SOURCE_CSV
+from features import NOTEBOOK_INPUTS
+from intervals import LEVELS
+from metrics import METRICS
+from registry import ModelRegistry, MODEL_SLUGS, SOURCES, is_servable, predict_batch
+
+PROFILE_DEFAULTS = {'sex': '', 'smoker': False, 'region': '', 'dependents': 0}
+LATENCY_WINDOW = 10_000  # Recent requests kept for percentiles
+MAX_BODY = 16 << 20
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ==========================================
+# 1. MODELS (registry first, train once on a miss)
+# ==========================================
+class ModelPool:
+    def __init__(self, registry=None, train=True):
+        self.registry = registry or ModelRegistry()
+        self.train = train
+        self._lock = threading.Lock()
+        self._model_locks = {}
+
+    def lock(self, name):
+        # Batchers run their predict calls in executor threads: one model is used by one thread at a time
+        return self._model_locks.setdefault(name, threading.Lock())
+
+    def get(self, name, source=None):
+        """(model, features) for `name`; reloaded automatically when its version changes."""
+        if name not in MODEL_SLUGS: raise RequestError(404, f"Unknown model: {name}")
+        hit = self.registry.load(name, servable=is_servable, source=source)
+        if hit: return hit
+        # Only a live model can be trained on a miss
+        if not self.train or source == 'notebook' or not os.path.exists(SOURCE_CSV):
+            raise RequestError(503, f"No {source or 'trained'} artifact for {name}")
+        with self._lock:  # One training run per process, even under concurrent misses
+            hit = self.registry.load(name, servable=is_servable, source=source)
+            if hit: return hit
+            from training import train_model
+            model = train_model(name)
+            self.registry.save(name, model, model.feature_encoder.features)
+            return model, model.feature_encoder.features
+
+
+def profile_columns(profiles):
+    """List of profile dicts -> column dict for the model's encoder (validated).
+
+    Member fields beyond the live profile (the notebook models' inputs) are passed
+    through as given; a profile that lacks one sends None, which the encoder imputes.
+    """
+    if not isinstance(profiles, list) or not profiles: raise RequestError(400, "Expected a non-empty list of profiles")
+    cols = {k: [] for k in ['age', 'bmi', *PROFILE_DEFAULTS]}
+    extra = [k for k in NOTEBOOK_INPUTS if k not in cols and any(isinstance(p, dict) and k in p for p in profiles)]
+    for p in profiles:
+        if not isinstance(p, dict): raise RequestError(400, "Each profile must be an object")
+        try:
+            if isinstance(p['age'], bool) or isinstance(p['bmi'], bool): raise TypeError  # bool is an int
+            cols['age'].append(float(p['age'])); cols['bmi'].append(float(p['bmi']))
+        except (KeyError, TypeError, ValueError):
+            raise RequestError(400, "Each profile needs numeric 'age' and 'bmi'")
+        for k, default in PROFILE_DEFAULTS.items():
+            v = p.get(k, p.get('children', default) if k == 'dependents' else default)
+            cols[k].append(v)
+        # Wrong JSON types are the client's error, not a 500 from deep inside the encoder
+        if not isinstance(cols['sex'][-1], str) or not isinstance(cols['region'][-1], str):
+            raise RequestError(400, "'sex' and 'region' must be strings")
+        if not isinstance(cols['smoker'][-1], (bool, int, float, str)): raise RequestError(400, "'smoker' must be a boolean, 0 / 1 or a string")
+        if isinstance(cols['dependents'][-1], (list, dict)): raise RequestError(400, "'dependents' must be numeric")
+        if any(isinstance(p.get(k), (list, dict)) for k in extra): raise RequestError(400, "Member fields must be strings, numbers or booleans")
+    try: cols['dependents'] = np.asarray(cols['dependents'], dtype=np.float64)
+    except (TypeError, ValueError): raise RequestError(400, "'dependents' must be numeric")
+    cols['smoker'] = np.asarray(cols['smoker'], dtype=object)
+    for k in extra: cols[k] = np.asarray([p.get(k) for p in profiles], dtype=object)
+    return cols
+
+
+# ==========================================
+# 2. MICRO-BATCHING
+# ==========================================
+class MicroBatcher:
+    """Coalesces concurrent requests for one model into a single predict call."""
+
+    def __init__(self, name, pool, stats, max_batch=512, max_wait=0.002, level=None, source=None):
+        self.name, self.pool, self.stats, self.level, self.source = name, pool, stats, level, source
+        self.max_batch, self.max_wait = max_batch, max_wait
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def submit(self, cols, n):
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((cols, n, fut))
+        return await fut
+
+    def _predict(self, items):
+        with self.pool.lock(self.name): return self._predict_locked(items)
+
+    def _predict_locked(self, items):
+        model, features = self.pool.get(self.name, self.source)
+        keys = dict.fromkeys(k for c, _, _ in items for k in c)  # Requests may send different extra fields
+        merged = {k: np.concatenate([np.asarray(c[k], dtype=object if k in ('sex', 'smoker', 'region') else None)
+                                     if k in c else np.full(n, None, dtype=object) for c, n, _ in items]) for k in keys}
+        preds = predict_batch(model, features, merged, level=self.level)
+        # With an interval level: one (prediction, lower, upper) row per profile
+        if self.level is not None: preds = np.column_stack(preds)
+        return preds, getattr(model, 'model_version', None)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            rows = items[0][1]
+            deadline = loop.time() + self.max_wait
+            while rows < self.max_batch:
+                if self.queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0: break
+                    try: item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError: break
+                else:
+                    item = self.queue.get_nowait()
+                items.append(item); rows += item[1]
+            try:
+                preds, version = await loop.run_in_executor(None, self._predict, items)
+            except Exception as exc:
+                for _, _, fut in items:
+                    if not fut.done(): fut.set_exception(exc)
+                continue
+            self.stats.batch(len(items), rows)
+            start = 0
+            for _, n, fut in items:
+                if not fut.done(): fut.set_result((preds[start:start + n], version))
+                start += n
+
+
+# ==========================================
+# 3. HTTP
+# ==========================================
+class Stats:
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = self.errors = self.rows = self.batches = self.batched_requests = 0
+        self.started = time.time()
+
+    def batch(self, requests, rows):
+        self.batches += 1; self.batched_requests += requests; self.rows += rows
+
+    def report(self):
+        lat = np.asarray(self.latencies) * 1000
+        pct = (lambda q: round(float(np.percentile(lat, q)), 3)) if len(lat) else (lambda q: None)
+        return {'pid': os.getpid(), 'uptime_s': round(time.time() - self.started, 1),
+                'requests': self.requests, 'errors': self.errors, 'rows': self.rows, 'batches': self.batches,
+                'mean_requests_per_batch': self.batched_requests / self.batches if self.batches else None,
+                'latency_ms': {'p50': pct(50), 'p90': pct(90), 'p99': pct(99), 'window': len(lat)}}
+
+
+class PredictionService:
+    def __init__(self, pool=None, max_batch=512, max_wait=0.002):
+        self.pool = pool or ModelPool()
+        self.max_batch, self.max_wait = max_batch, max_wait
+        self.stats = Stats()
+        self.batchers = {}
+
+    async def predict(self, body):
+        name = body.get('model', 'Random Forest')
+        if not isinstance(name, str): raise RequestError(400, "'model' must be a string")
+        single = 'profile' in body
+        profiles = [body['profile']] if single else body.get('profiles')
+        level = body.get('level')
+        if level is not None and level not in LEVELS: raise RequestError(400, f"'level' must be one of {list(LEVELS)}")
+        source = body.get('source')
+        if source is not None and source not in SOURCES: raise RequestError(400, f"'source' must be one of {list(SOURCES)}")
+        cols = profile_columns(profiles)
+        key = (name, level, source)
+        if key not in self.batchers:
+            if name not in MODEL_SLUGS: raise RequestError(404, f"Unknown model: {name}")
+            self.batchers[key] = MicroBatcher(name, self.pool, self.stats, self.max_batch, self.max_wait, level, source)
+        preds, version = await self.batchers[key].submit(cols, len(profiles))
+        out = {'model': name, 'version': version}
+        if source is not None: out['source'] = source
+        # NaN bounds (no calibration for this model) go out as null
+        num = lambda v: float(v) if v == v else None
+        if level is None: point = preds
+        else:
+            point, out['level'] = preds[:, 0], level
+            if single: out['lower'], out['upper'] = num(preds[0, 1]), num(preds[0, 2])
+            else: out['lower'], out['upper'] = [num(v) for v in preds[:, 1]], [num(v) for v in preds[:, 2]]
+        if single: out['prediction'] = float(point[0])
+        else: out['predictions'] = [float(v) for v in point]
+        return out
+
+    async def route(self, method, path, body):
+        if method == 'POST' and path == '/predict':
+            try: payload = json.loads(body or b'{}')
+            except ValueError: raise RequestError(400, "Body must be JSON")
+            if not isinstance(payload, dict): raise RequestError(400, "Body must be a JSON object")
+            return await self.predict(payload)
+        if method == 'GET' and path == '/stats': return self.stats.report()
+        if method == 'GET' and path == '/metrics': return METRICS.render()
+        if method == 'GET' and path == '/health': return {'status': 'ok'}
+        if method == 'GET' and path == '/models':
+            reg = self.pool.registry
+            models = [{'model': n, 'version': reg.version(n), 'sources': [s for s in SOURCES if reg.load(n, servable=is_servable, source=s)]}
+                      for n in MODEL_SLUGS]
+            return {'models': [m for m in models if m['sources']]}
+        raise RequestError(404, f"No route for {method} {path}")
+
+    async def handle(self, reader, writer):
+        # Minimal HTTP/1.1 with keep-alive; one request at a time per connection
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                lines = head.decode('latin-1').split('\r\n')
+                method, path, version = lines[0].split(' ', 2)
+                headers = {k.strip().lower(): v.strip() for k, v in (l.split(':', 1) for l in lines[1:] if ':' in l)}
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, {'error': f"Body over {MAX_BODY:,} bytes"}, keep=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                t0 = time.perf_counter()
+                try:
+                    status, result = 200, await self.route(method, path.split('?', 1)[0], body)
+                except RequestError as exc:
+                    status, result = exc.status, {'error': str(exc)}
+                except Exception as exc:
+                    status, result = 500, {'error': f"{type(exc).__name__}: {exc}"}
+                if path.startswith('/predict'):
+                    self.stats.requests += 1
+                    if status == 200:
+                        self.stats.latencies.append(time.perf_counter() - t0)
+                        METRICS.observe('request', self.stats.latencies[-1])
+                    else: self.stats.errors += 1
+
+                keep = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, result, keep)
+                if not keep: break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, result, keep):
+        # Text results (GET /metrics) go out as the Prometheus exposition format
+        text = isinstance(result, str)
+        payload = result.encode() if text else json.dumps(result).encode()
+        ctype = 'text/plain; version=0.0.4' if text else 'application/json'
+        writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                     f"Content-Type: {ctype}\r\nContent-Length: {len(payload)}\r\n"
+                     f"Connection: {'keep-alive' if keep else 'close'}\r\n\r\n".encode() + payload)
+        await writer.drain()
+
+
+# ==========================================
+# 4. ENTRY POINT (pre-forked workers share one listening socket)
+# ==========================================
+async def _serve(sock, args):
+    service = PredictionService(ModelPool(train=not args.no_train), args.max_batch, args.max_wait_ms / 1000)
+    for name in args.preload or []: await asyncio.get_running_loop().run_in_executor(None, service.pool.get, name)
+    server = await asyncio.start_server(service.handle, sock=sock)
+    async with server: await server.serve_forever()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog='service', description="Headless async prediction service.")
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8765)
+    p.add_argument('--workers', type=int, default=1, help="Worker processes sharing the socket")
+    p.add_argument('--max-batch', type=int, default=512, help="Max rows per model call")
+    p.add_argument('--max-wait-ms', type=float, default=2.0, help="How long a batch waits for company")
+    p.add_argument('--preload', nargs='*', help="Models to load (or train) before accepting requests")
+    p.add_argument('--no-train', action='store_true', help="Serve persisted models only")
+    args = p.parse_args(argv)
+
+    sock = socket.create_server((args.host, args.port), reuse_port=hasattr(socket, 'SO_REUSEPORT'), backlog=1024)
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} worker(s)", file=sys.stderr)
+    children = []
+    for _ in range(args.workers - 1):
+        pid = os.fork()
+        if pid == 0:
+            children = None
+            break
+        children.append(pid)
+    try:
+        asyncio.run(_serve(sock, args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children or []:
+            try: os.kill(pid, 2)
+            except OSError: pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+"""Fit and benchmark the whole model catalog in parallel.
+
+    python -m training --workers 4
+
+Every model is fitted in its own worker process, saved through the registry and
+scored into a leaderboard (Trained_Models/live/leaderboard.csv) that the Model
+Insights page reads.
+
+Training is sized by time, not by a fixed row cap: linear / ridge regression
+stream the whole store in chunks (exact normal equations), and every other model
+gets the largest random sample whose fit is projected to finish inside
+TRAIN_BUDGET_S. Each fitted model records the rows it saw in `training_rows`, and
+carries its prediction-interval calibration (intervals.py) in `calibration`.
+"""
+import argparse
+import importlib.util
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from datastore import SOURCE_CSV, HAS_ARROW, ensure_store, read_table, open_table, column_names
+from features import FeatureEncoder
+from intervals import CALIBRATION_ROWS, MAX_CALIBRATION_ROWS, calibrate
+from registry import ModelRegistry, LIVE_DIR
+
+# Estimator libraries are imported when a model is built, not at import time
+# (scikit-learn + scipy alone cost ~1.4 s); availability is a cheap spec lookup.
+HAS_SKLEARN = importlib.util.find_spec('sklearn') is not None
+HAS_XGB = importlib.util.find_spec('xgboost') is not None
+HAS_LGBM = importlib.util.find_spec('lightgbm') is not None
+
+# ==========================================
+# 1. MODEL ZOO
+# ==========================================
+TARGET = 'annual_medical_cost'
+RAW_FEATURES = ['age', 'bmi', 'sex', 'smoker', 'region']
+SCALED_MODELS = {"K-Nearest Neighbors", "Support Vector Machine (SVR)"}
+LEADERBOARD = os.path.join(LIVE_DIR, 'leaderboard.csv')
+
+# Row budget: fit as many rows as fit in this many seconds (same start-up cost as the old 5k sample)
+TRAIN_BUDGET_S = float(os.environ.get('TRAIN_BUDGET_S', 2.0))
+PILOT_ROWS = 1000  # Timed pilot fits on this many rows and 4x as many project the full fit time
+MIN_TRAIN_ROWS = 5000  # Fewest rows a budgeted fit uses (the old fixed sample)
+SCORE_SHARE = 0.15  # Share of the budget kept for scoring calibration rows the fit left unused
+CHUNK_ROWS = 100_000
+STREAMING_MODELS = {"Linear Regression", "Ridge Regression"}  # Fitted out-of-core on the full store
+FIT_EXPONENT = {"Support Vector Machine (SVR)": 2}  # Fit time ~ rows ** exponent (default 1)
+
+SKLEARN_MODELS = [
+    "Random Forest",
+    "Gradient Boosting",
+    "Histogram Gradient Boosting",
+    "AdaBoost",
+    "Extra Trees",
+    "Decision Tree",
+    "Linear Regression",
+    "Ridge Regression",
+    "Lasso Regression",
+    "ElasticNet",
+    "K-Nearest Neighbors",
+    "Support Vector Machine (SVR)",
+]
+
+
+def model_types():
+    """Model names that can be built in this environment, in menu order."""
+    names = list(SKLEARN_MODELS) if HAS_SKLEARN else []
+    if HAS_XGB: names.append("XGBoost")
+    if HAS_LGBM: names.append("LightGBM")
+    return names
+
+
+def make_model(model_type, n_jobs=1):
+    if model_type == "XGBoost" and HAS_XGB:
+        from xgboost import XGBRegressor
+        return XGBRegressor(n_estimators=200, max_depth=7, learning_rate=0.1, random_state=42, n_jobs=n_jobs)
+    if model_type == "LightGBM" and HAS_LGBM:
+        from lightgbm import LGBMRegressor
+        return LGBMRegressor(n_estimators=200, max_depth=7, random_state=42, verbose=-1, n_jobs=n_jobs)
+    from sklearn.ensemble import (RandomForestRegressor, GradientBoostingRegressor, AdaBoostRegressor,
+                                  ExtraTreesRegressor, HistGradientBoostingRegressor)
+    from sklearn.linear_model import LinearRegression, Ridge, Lasso, ElasticNet
+    from sklearn.tree import DecisionTreeRegressor
+    from sklearn.neighbors import KNeighborsRegressor
+    from sklearn.svm import SVR
+    if model_type == "Random Forest": return RandomForestRegressor(n_estimators=50, max_depth=10, random_state=42, n_jobs=n_jobs)
+    if model_type == "Gradient Boosting": return GradientBoostingRegressor(n_estimators=100, max_depth=3, random_state=42)
+    if model_type == "Histogram Gradient Boosting": return HistGradientBoostingRegressor(max_iter=200, random_state=42)
+    if model_type == "AdaBoost": return AdaBoostRegressor(n_estimators=100, learning_rate=0.1, random_state=42)
+    if model_type == "Extra Trees": return ExtraTreesRegressor(n_estimators=50, max_depth=10, random_state=42, n_jobs=n_jobs)
+    if model_type == "Decision Tree": return DecisionTreeRegressor(max_depth=10)
+    if model_type == "Linear Regression": return LinearRegression()
+    if model_type == "Ridge Regression": return Ridge()
+    if model_type == "Lasso Regression": return Lasso()
+    if model_type == "ElasticNet": return ElasticNet()
+    if model_type == "K-Nearest Neighbors": return KNeighborsRegressor(n_neighbors=5)
+    if model_type == "Support Vector Machine (SVR)": return SVR()
+    raise ValueError(f"Unknown or unavailable model: {model_type}")
+
+
+# ==========================================
+# 2. DATA + FIT
+# ==========================================
+def load_training_data(source=SOURCE_CSV, sample=None):
+    """(encoder, X, y) from the columnar store, or None when the CSV is missing.
+
+    Rows come back in a fixed random order, so any prefix is a random sample.
+    """
+    if not os.path.exists(source): return None
+    df = read_table(RAW_FEATURES + ['children', 'dependents', TARGET], source)
+
+    dep_col = 'children' if 'children' in df.columns else 'dependents'
+    if dep_col not in df.columns: df['dependents'] = 0; dep_col = 'dependents'
+    df = df[RAW_FEATURES + [dep_col, TARGET]].dropna()
+    order = np.random.default_rng(42).permutation(len(df))
+    if sample: order = order[:sample]
+    df = df.iloc[order]
+
+    # Encoding (same encoder object is shipped with the model for serving)
+    encoder = FeatureEncoder.fit(df)
+    return encoder, encoder.transform(df), df[TARGET].to_numpy(dtype=np.float64)
+
+
+def iter_training_chunks(encoder, source=SOURCE_CSV, chunk_rows=CHUNK_ROWS):
+    """Encoded (X, y) chunks over the whole store, without materialising it."""
+    cols = RAW_FEATURES + [encoder.dep_col, TARGET]
+    if HAS_ARROW:
+        table = open_table(source)
+        table = table.select([c for c in cols if c in table.schema.names])
+        chunks = (b.to_pandas() for b in table.to_batches(max_chunksize=chunk_rows))
+    else:
+        chunks = pd.read_csv(source, usecols=lambda c: c in cols, chunksize=chunk_rows)
+    for df in chunks:
+        df = df.dropna(subset=[c for c in cols if c in df.columns])
+        if len(df): yield encoder.transform(df), df[TARGET].to_numpy(dtype=np.float64)
+
+
+def fit_model(model_type, encoder, X, y, n_jobs=1):
+    model = make_model(model_type, n_jobs)
+    if model_type in SCALED_MODELS:
+        from sklearn.preprocessing import StandardScaler
+        scaler = StandardScaler(); X = scaler.fit_transform(X)
+        model.custom_scaler = scaler
+    model.fit(X, y)
+    model.feature_encoder = encoder
+    model.training_rows = len(X)
+    return model
+
+
+def fit_within_budget(model_type, encoder, X, y, budget_s=TRAIN_BUDGET_S):
+    """Fit on the largest prefix of X whose fit is projected to end inside `budget_s`.
+
+    Timed pilots on 1k and 4k rows give a fixed + per-row cost (time = a + b * rows ** e).
+    A full fit projected to take no more than the budget itself uses every row (the pilots
+    are a sunk cost); otherwise the fit gets what the pilots left, and never fewer than
+    MIN_TRAIN_ROWS (the old fixed sample) rows.
+    """
+    n = len(X)
+    if not budget_s or n <= MIN_TRAIN_ROWS: return fit_model(model_type, encoder, X, y)
+    e = FIT_EXPONENT.get(model_type, 1)
+    fit_model(model_type, encoder, X[:100], y[:100])  # Warm-up: lazy imports must not count as fit cost
+    start, times = time.perf_counter(), []
+    for size in (PILOT_ROWS, 4 * PILOT_ROWS):
+        t0 = time.perf_counter()
+        fit_model(model_type, encoder, X[:size], y[:size])
+        times.append(time.perf_counter() - t0)
+    b = max((times[1] - times[0]) / ((4 * PILOT_ROWS) ** e - PILOT_ROWS ** e), 1e-12)
+    a = max(times[0] - b * PILOT_ROWS ** e, 0.0)
+    # Re-checked against the clock: the pilots' own time is spent
+    left = budget_s - (time.perf_counter() - start) - a
+    target = n if a + b * n ** e <= budget_s else int((max(left, 0) / b) ** (1 / e))
+    target = min(n, max(target, MIN_TRAIN_ROWS))
+    return fit_model(model_type, encoder, X[:target], y[:target])
+
+
+# --- out-of-core linear models -------------------------------------------
+# Mergeable sufficient statistics (row count, column means, centred scatter
+# matrix of [X, y]); the least-squares solution only depends on these, so the
+# same fold serves chunked training and incremental batch updates.
+def _fold(stats, X, y):
+    Z = np.column_stack([X, y]); nb = len(Z); mb = Z.mean(axis=0); Zc = Z - mb
+    if stats is None: return nb, mb, Zc.T @ Zc
+    n, mean, C = stats
+    d = mb - mean; tot = n + nb
+    return tot, mean + d * nb / tot, C + Zc.T @ Zc + np.outer(d, d) * n * nb / tot
+
+
+def _solve(model, stats):
+    n, mean, C = stats
+    k = len(mean) - 1
+    alpha = model.alpha if type(model).__name__ == 'Ridge' else 0.0
+    coef = np.linalg.lstsq(C[:k, :k] + alpha * np.eye(k), C[:k, k], rcond=None)[0]
+    model.coef_, model.intercept_, model.n_features_in_ = coef, mean[k] - mean[:k] @ coef, k
+    model.sufficient_stats, model.training_rows = stats, n
+    return model
+
+
+def fit_streaming(model_type, encoder, chunks):
+    stats = None
+    for X, y in chunks: stats = _fold(stats, X, y)
+    if stats is None: raise ValueError("No training rows")
+    model = _solve(make_model(model_type), stats)
+    model.feature_encoder = encoder
+    return model
+
+
+def update_streaming(model, X, y):
+    # Exact refit on old + new rows from the stored statistics alone
+    return _solve(model, _fold(model.sufficient_stats, X, y))
+
+
+def train_model(model_type, source=SOURCE_CSV, budget_s=TRAIN_BUDGET_S, sample=None, data=None):
+    """Fit `model_type` on as much of the store as the time budget allows, then calibrate its intervals."""
+    if model_type in STREAMING_MODELS and not sample:
+        encoder = FeatureEncoder.fit(pd.DataFrame(columns=column_names(source)))
+        model = fit_streaming(model_type, encoder, iter_training_chunks(encoder, source))
+        # Fitted on every row, so calibrated in-sample: a handful of coefficients over the whole store barely overfit
+        hit = load_training_data(source, CALIBRATION_ROWS)
+        model.calibration = calibrate(model, hit[1], hit[2]) if hit else None
+        return model
+    encoder, X, y = data or load_training_data(source, sample)
+    t0 = time.perf_counter()
+    # The tail of the shuffled rows is held out; its residuals (and those of any rows the
+    # budget left unused, which the fit never saw either) calibrate the intervals
+    n = len(X) - min(CALIBRATION_ROWS, len(X) // 5)
+    model = fit_within_budget(model_type, encoder, X[:n], y[:n], budget_s * (1 - SCORE_SHARE))
+    start = max(model.training_rows, len(X) - MAX_CALIBRATION_ROWS)
+    if budget_s and start < n < len(X):
+        # The held-out tail is always scored; unused rows only as far as what is left of the budget pays for
+        left = budget_s - (time.perf_counter() - t0)
+        extra = int(left / _score_cost(model, X[n:])) - (len(X) - n) if left > 0 else 0
+        start = max(start, n - max(extra, 0))
+    model.calibration = calibrate(model, X[start:], y[start:])
+    return model
+
+
+def _score_cost(model, X, rows=200):
+    # Seconds per row of a predict call, timed on a small probe
+    X = X[:rows]
+    if hasattr(model, 'custom_scaler'): X = model.custom_scaler.transform(X)
+    t0 = time.perf_counter(); model.predict(X)
+    return max((time.perf_counter() - t0) / len(X), 1e-9)
+
+
+# ==========================================
+# 3. BENCHMARK + PARALLEL CATALOG RUN
+# ==========================================
+def benchmark(model_type, source=SOURCE_CSV, sample=None, cv=3, budget_s=TRAIN_BUDGET_S):
+    """Fit within the budget, then record fit time, predict latency, size and CV metrics."""
+    from sklearn.model_selection import KFold, cross_validate
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    data = load_training_data(source, sample)
+    t0 = time.perf_counter()
+    model = train_model(model_type, source, budget_s, sample, data)
+    fit_s = time.perf_counter() - t0
+    # CV on the same rows the model was fitted on
+    X, y = data[1][:model.training_rows], data[2][:model.training_rows]
+
+    Xp = model.custom_scaler.transform(X) if hasattr(model, 'custom_scaler') else X
+    single = []
+    for i in range(min(50, len(Xp))):
+        t0 = time.perf_counter(); model.predict(Xp[i:i + 1]); single.append(time.perf_counter() - t0)
+    n_batch = min(1000, len(Xp))
+    t0 = time.perf_counter(); model.predict(Xp[:n_batch]); batch_s = time.perf_counter() - t0
+
+    est = make_model(model_type)
+    if model_type in SCALED_MODELS: est = make_pipeline(StandardScaler(), est)
+    scores = cross_validate(est, X, y, cv=KFold(cv, shuffle=True, random_state=42),
+                            scoring=('r2', 'neg_root_mean_squared_error', 'neg_mean_absolute_error'))
+    row = {
+        'model': model_type,
+        'rows': model.training_rows,
+        'rows_available': len(data[1]),
+        'cv_r2': scores['test_r2'].mean(),
+        'cv_rmse': -scores['test_neg_root_mean_squared_error'].mean(),
+        'cv_mae': -scores['test_neg_mean_absolute_error'].mean(),
+        'fit_s': fit_s,
+        'predict_single_ms': np.median(single) * 1000,
+        'predict_batch_us_per_row': batch_s / n_batch * 1e6,
+        'size_kb': len(pickle.dumps(model)) / 1024,
+    }
+    return model, row
+
+
+def _train_one(model_type, source, sample, cv, budget_s):
+    # Worker: one BLAS/OpenMP thread each so the pool size is the core budget
+    def run():
+        model, row = benchmark(model_type, source, sample, cv, budget_s)
+        return model_type, model, model.feature_encoder.features, row
+    try: from threadpoolctl import threadpool_limits
+    except ImportError: return run()
+    with threadpool_limits(limits=1): return run()
+
+
+def train_all(models=None, workers=None, source=SOURCE_CSV, sample=None, cv=3, budget_s=TRAIN_BUDGET_S, registry=None):
+    """Fit + benchmark `models` (default: whole catalog) across a bounded process pool."""
+    models = list(models or model_types())
+    workers = workers or max(1, min(len(models), (os.cpu_count() or 2) - 1))
+    registry = registry or ModelRegistry()
+    ensure_store(source)  # Build the columnar store once, before workers read it
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_train_one, m, source, sample, cv, budget_s) for m in models]
+        for fut in as_completed(futures):
+            name, model, features, row = fut.result()
+            # Saved from the parent so versions.json has a single writer
+            registry.save(name, model, features)
+            row['version'] = registry.version(name)
+            rows.append(row)
+
+    board = pd.DataFrame(rows).sort_values('cv_r2', ascending=False).reset_index(drop=True)
+    board['trained_at'] = pd.Timestamp.now().isoformat(timespec='seconds')
+    write_leaderboard(board)
+    return board
+
+
+def write_leaderboard(board, path=LEADERBOARD):
+    # Merge so a partial run only replaces the rows it re-benchmarked
+    old = read_leaderboard(path)
+    if old is not None: board = pd.concat([old[~old['model'].isin(board['model'])], board]).sort_values('cv_r2', ascending=False)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    board.to_csv(f'{path}.tmp', index=False)
+    os.replace(f'{path}.tmp', path)
+
+
+def read_leaderboard(path=LEADERBOARD):
+    return pd.read_csv(path) if os.path.exists(path) else None
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog='training', description="Fit and benchmark the model catalog in parallel.")
+    p.add_argument('--models', nargs='*', help="Subset of model names (default: all available)")
+    p.add_argument('--workers', type=int, help="Process pool size (default: cores - 1)")
+    p.add_argument('--sample', type=int, default=0, help="Hard cap on training rows (0 = no cap)")
+    p.add_argument('--budget', type=float, default=TRAIN_BUDGET_S, help="Per-model fit time budget in seconds (0 = always use every row)")
+    p.add_argument('--cv', type=int, default=3)
+    args = p.parse_args(argv)
+
+    t0 = time.perf_counter()
+    board = train_all(args.models, args.workers, sample=args.sample, cv=args.cv, budget_s=args.budget)
+    print(board.to_string(index=False), file=sys.stderr)
+    print(f"Trained {len(board)} models in {time.perf_counter() - t0:.1f}s wall-clock -> {LEADERBOARD}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
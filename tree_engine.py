@@ -0,0 +1,305 @@
+"""Flattened tree-ensemble inference.
+
+    python -m tree_engine                 # export + verify every tree model in the registry
+
+Random forests, extra trees, decision trees, (histogram) gradient boosting,
+XGBoost and LightGBM models are exported into one set of contiguous node arrays
+(feature, threshold, left, right, default_left, value, plus the training cover of
+every node for path-dependent attributions). FlatEnsemble.predict walks
+every tree for a whole batch at once with NumPy gathers (one step per tree level),
+which removes the per-estimator Python dispatch that dominates single-row predict.
+
+Each export is checked bit-for-bit against the source model's own predict before
+it is saved, and timed against it: `max_rows` is the largest batch size where the
+flat walk still wins (single rows always do; large batches of deep boosted trees
+are faster in the libraries' native code). The registry attaches the engine to the
+model and predict_batch uses it up to that size.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ENGINE_VERSION = 1
+
+
+class FlatEnsemble:
+    """All trees of an additive ensemble in contiguous arrays.
+
+    Leaves loop back to themselves (left == right == node), so a batch walk is
+    just `depth` rounds of `node = where(x <= threshold, left, right)`.
+    Prediction = cumulative sum of [base, leaf_1, ..., leaf_T] in `acc_dtype`
+    (same order as the source library), divided by `divisor` for averaging models.
+    """
+    ARRAYS = ['feature', 'threshold', 'left', 'right', 'default_left', 'value', 'roots']
+    OPTIONAL = ['cover']  # Training rows (or hessian) per node; engines saved before it have None
+
+    def __init__(self, feature, threshold, left, right, default_left, value, roots, depth,
+                 base=0.0, divisor=1, x_dtype='float64', acc_dtype='float64', nan_as=None, max_rows=None, meta=None,
+                 cover=None):
+        self.feature, self.threshold, self.cover = feature, threshold, cover
+        self.left, self.right, self.default_left = left, right, default_left
+        self.value, self.roots, self.depth = value, roots, int(depth)
+        self.base, self.divisor = base, divisor
+        self.x_dtype, self.acc_dtype, self.nan_as = np.dtype(x_dtype), np.dtype(acc_dtype), nan_as
+        self.max_rows = max_rows  # Largest batch the flat walk is faster for (None = unmeasured)
+        self.meta = meta or {}
+        self._children = np.column_stack([left, right]).ravel()  # [2 * node + went_right]
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, k).nbytes for k in self.ARRAYS + self.OPTIONAL if getattr(self, k) is not None)
+
+    def predict(self, X, per_tree=False):
+        """Predictions for X; with `per_tree`, (predictions, every tree's output) from the same walk."""
+        X = np.ascontiguousarray(X, dtype=self.x_dtype)
+        if X.ndim == 1: X = X[None, :]
+        if self.nan_as is not None: X = np.where(np.isnan(X), self.nan_as, X)
+        has_nan = self.nan_as is None and np.isnan(X).any()
+        flat, row_start = X.ravel(), (np.arange(len(X)) * X.shape[1])[:, None]
+        node = np.broadcast_to(self.roots, (len(X), self.n_trees))
+        for _ in range(self.depth):
+            x = flat[row_start + self.feature[node]]
+            go_right = ~(x <= self.threshold[node])  # NaN compares False -> right unless default_left
+            if has_nan: go_right &= ~(np.isnan(x) & self.default_left[node])
+            node = self._children[2 * node + go_right]
+        leaves = self.value[node]
+        # Sequential accumulation (cumsum), base first: identical rounding to the source library
+        acc = np.empty((len(X), self.n_trees + 1), dtype=self.acc_dtype)
+        acc[:, 0] = self.base
+        acc[:, 1:] = leaves
+        out = np.cumsum(acc, axis=1, dtype=self.acc_dtype)[:, -1]
+        if self.divisor != 1: out = out / self.divisor
+        return (out, leaves) if per_tree else out
+
+    # --- persistence -----------------------------------------------------
+    def save(self, path):
+        meta = dict(self.meta, engine_version=ENGINE_VERSION, depth=self.depth, base=float(self.base),
+                    divisor=self.divisor, x_dtype=self.x_dtype.name, acc_dtype=self.acc_dtype.name, nan_as=self.nan_as,
+                    max_rows=self.max_rows)
+        tmp = f'{path}.{os.getpid()}.tmp.npz'
+        arrays = {k: getattr(self, k) for k in self.ARRAYS + self.OPTIONAL if getattr(self, k) is not None}
+        np.savez(tmp, __meta__=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            meta = json.loads(str(z['__meta__']))
+            arrays = {k: z[k] for k in cls.ARRAYS + cls.OPTIONAL if k in z}
+        if meta.get('engine_version') != ENGINE_VERSION: return None
+        acc = np.dtype(meta['acc_dtype'])
+        return cls(**arrays, depth=meta['depth'], base=acc.type(meta['base']), divisor=meta['divisor'],
+                   x_dtype=meta['x_dtype'], acc_dtype=meta['acc_dtype'], nan_as=meta['nan_as'],
+                   max_rows=meta.get('max_rows'), meta=meta)
+
+
+# ==========================================
+# 1. EXPORTERS (one per library, all -> list of per-tree node dicts)
+# ==========================================
+def _sklearn_tree(tree, scale=None):
+    t = tree.tree_
+    value = t.value[:, 0, 0]
+    if scale is not None: value = scale * value  # Same product the library computes per row
+    missing = getattr(t, 'missing_go_to_left', np.zeros(t.node_count, dtype=np.uint8))
+    return dict(feature=t.feature, threshold=t.threshold, left=t.children_left, right=t.children_right,
+                default_left=missing.astype(bool), value=value, cover=t.weighted_n_node_samples)
+
+
+def _hist_predictor(pred):
+    nodes = pred.nodes
+    return dict(feature=nodes['feature_idx'], threshold=nodes['num_threshold'],
+                left=np.where(nodes['is_leaf'], -1, nodes['left'].astype(np.int64)),
+                right=np.where(nodes['is_leaf'], -1, nodes['right'].astype(np.int64)),
+                default_left=nodes['missing_go_to_left'].astype(bool), value=nodes['value'], cover=nodes['count'])
+
+
+def _xgb_trees(booster):
+    model = json.loads(booster.save_raw('json'))['learner']
+    trees = []
+    for t in model['gradient_booster']['model']['trees']:
+        if any(t['split_type']): raise ValueError("categorical splits are not supported")
+        left = np.asarray(t['left_children'])
+        cond = np.asarray(t['split_conditions'], dtype=np.float32)
+        # XGBoost sends x < c left; for float32 x that is x <= the float32 just below c
+        thr = np.where(left == -1, cond, np.nextafter(cond, np.float32(-np.inf)))
+        trees.append(dict(feature=np.asarray(t['split_indices']), threshold=thr, left=left,
+                          right=np.asarray(t['right_children']), default_left=np.asarray(t['default_left'], dtype=bool),
+                          value=cond, cover=np.asarray(t['sum_hessian'])))
+    base = np.float32(float(model['learner_model_param']['base_score'].strip('[]')))
+    return trees, base
+
+
+def _lgbm_trees(booster):
+    dump = booster.dump_model()
+    trees, missing = [], set()
+    for info in dump['tree_info']:
+        nodes = []
+
+        def walk(n):
+            i = len(nodes); nodes.append(None)
+            if 'leaf_value' in n or 'split_feature' not in n:
+                nodes[i] = (0, 0.0, -1, -1, False, n.get('leaf_value', 0.0), n.get('leaf_count', 0))
+                return i
+            if n['decision_type'] != '<=' or n['missing_type'] == 'Zero':
+                raise ValueError("only numeric '<=' splits with None/NaN missing handling are supported")
+            missing.add(n['missing_type'])
+            nodes[i] = [n['split_feature'], n['threshold'], walk(n['left_child']), walk(n['right_child']),
+                        n['missing_type'] == 'NaN' and n['default_left'], 0.0, n.get('internal_count', 0)]
+            return i
+
+        walk(info['tree_structure'])
+        f, thr, l, r, d, v, c = zip(*nodes)
+        trees.append(dict(feature=np.asarray(f), threshold=np.asarray(thr), left=np.asarray(l), right=np.asarray(r),
+                          default_left=np.asarray(d, dtype=bool), value=np.asarray(v, dtype=np.float64), cover=np.asarray(c)))
+    # LightGBM reads NaN as 0.0 unless the split declares missing_type NaN; one policy per model here
+    if len(missing) > 1: raise ValueError("mixed missing-value handling is not supported")
+    return trees, dump.get('average_output', False), (None if missing == {'NaN'} else 0.0)
+
+
+def _pack(trees, **kw):
+    offsets = np.cumsum([0] + [len(t['feature']) for t in trees])
+    feature, threshold, left, right, default_left, value, cover, depth = [], [], [], [], [], [], [], 0
+    for off, t in zip(offsets, trees):
+        idx = np.arange(len(t['feature']))
+        leaf = np.asarray(t['left']) < 0
+        feature.append(np.where(leaf, 0, t['feature']))
+        threshold.append(np.asarray(t['threshold'], dtype=np.float64))
+        left.append(np.where(leaf, idx, t['left']) + off)
+        right.append(np.where(leaf, idx, t['right']) + off)
+        default_left.append(np.asarray(t['default_left'], dtype=bool))
+        value.append(np.asarray(t['value']))
+        cover.append(np.asarray(t['cover'], dtype=np.float64))
+        depth = max(depth, _depth(np.asarray(t['left']), np.asarray(t['right'])))
+    acc = np.dtype(kw.get('acc_dtype', 'float64'))
+    return FlatEnsemble(np.concatenate(feature).astype(np.int32), np.concatenate(threshold),
+                        np.concatenate(left).astype(np.int32), np.concatenate(right).astype(np.int32),
+                        np.concatenate(default_left), np.concatenate(value).astype(acc),
+                        offsets[:-1].astype(np.int32), depth, cover=np.concatenate(cover), **kw)
+
+
+def _depth(left, right):
+    depth, frontier = 0, [0]
+    while frontier:
+        frontier = [c for n in frontier for c in (left[n], right[n]) if c >= 0]
+        if frontier: depth += 1
+    return depth
+
+
+def flatten(model):
+    """FlatEnsemble for a supported tree model, or None."""
+    name = type(model).__name__
+    if name == 'DecisionTreeRegressor':
+        return _pack([_sklearn_tree(model)], x_dtype='float32')
+    if name in ('RandomForestRegressor', 'ExtraTreesRegressor'):
+        return _pack([_sklearn_tree(e) for e in model.estimators_], divisor=len(model.estimators_), x_dtype='float32')
+    if name == 'GradientBoostingRegressor':
+        base = float(model._raw_predict_init(np.zeros((1, model.n_features_in_)))[0, 0])
+        return _pack([_sklearn_tree(e, model.learning_rate) for e in model.estimators_[:, 0]], base=base, x_dtype='float32')
+    if name == 'HistGradientBoostingRegressor':
+        if model.n_trees_per_iteration_ != 1 or getattr(model, 'is_categorical_', None) is not None: return None
+        base = float(np.asarray(model._baseline_prediction).ravel()[0])
+        return _pack([_hist_predictor(p[0]) for p in model._predictors], base=base)
+    if name == 'XGBRegressor':
+        trees, base = _xgb_trees(model.get_booster())
+        return _pack(trees, base=base, x_dtype='float32', acc_dtype='float32')
+    if name == 'LGBMRegressor':
+        trees, average, nan_as = _lgbm_trees(model.booster_)
+        return _pack(trees, divisor=len(trees) if average else 1, nan_as=nan_as)
+    return None
+
+
+# ==========================================
+# 2. VERIFY + EXPORT
+# ==========================================
+def probe_rows(engine, n=2000, seed=0):
+    """Inputs that hit every split boundary exactly plus random rows around them."""
+    rng = np.random.default_rng(seed)
+    internal = engine.left != np.arange(len(engine.left))
+    n_features = int(engine.feature.max()) + 1 if internal.any() else 1
+    X = rng.normal(size=(n, n_features))
+    for j in range(n_features):
+        thr = engine.threshold[internal & (engine.feature == j)]
+        if not len(thr): continue
+        lo, hi = thr.min(), thr.max()
+        X[:, j] = lo + (hi - lo) * rng.uniform(-0.1, 1.1, size=n)
+        X[:len(thr), j] = thr[:n]  # Exact threshold values: the <= vs < edge
+    return X
+
+
+def verify(model, engine, X):
+    """True when the engine reproduces model.predict(X) bit-for-bit."""
+    ref = model.predict(X)
+    out = engine.predict(X)
+    return ref.dtype == out.dtype and np.array_equal(ref, out)
+
+
+def _model_input(model, X):
+    # Pad probes to the model's width and name the columns if it was fitted on a DataFrame
+    n_in = getattr(model, 'n_features_in_', None)
+    if n_in is not None and X.shape[1] < n_in: X = np.pad(X, ((0, 0), (0, n_in - X.shape[1])))
+    names = getattr(model, 'feature_names_in_', None)
+    return pd.DataFrame(X, columns=names) if names is not None else X
+
+
+def crossover(model, engine, X, sizes=(1, 8, 32, 128, 512, 2048)):
+    """Largest batch size (from `sizes`) where the flat walk beats model.predict; 0 if never."""
+    best = 0
+    for n in sizes:
+        if n > len(X): break
+        ref = min(_time(model.predict, X[:n]) for _ in range(3))
+        flat = min(_time(engine.predict, X[:n]) for _ in range(3))
+        if flat >= ref: break
+        best = n
+    return best
+
+
+def export(model, path, X=None, meta=None):
+    """Flatten, verify and save `model`; returns the engine or None if unsupported / mismatched."""
+    try: engine = flatten(model)
+    except Exception: return None
+    if engine is None: return None
+    X = _model_input(model, probe_rows(engine) if X is None else X)
+    if not verify(model, engine, X): return None
+    engine.max_rows = crossover(model, engine, X)
+    engine.meta = dict(meta or {}, model_version=getattr(model, 'model_version', None), model_type=type(model).__name__)
+    engine.save(path)
+    return engine
+
+
+def main(argv=None):
+    from registry import ModelRegistry, MODEL_SLUGS
+    p = argparse.ArgumentParser(prog='tree_engine', description="Export and verify flattened tree ensembles.")
+    p.add_argument('models', nargs='*', help="Model names (default: every registry model)")
+    args = p.parse_args(argv)
+
+    reg = ModelRegistry()
+    for name in args.models or list(MODEL_SLUGS):
+        hit = reg.load(name)
+        if not hit: continue
+        model, _ = hit
+        engine = reg.export_engine(name, model)
+        if engine is None:
+            print(f"{name}: not exportable", file=sys.stderr); continue
+        X = _model_input(model, probe_rows(engine, 1))
+        ref = min(_time(model.predict, X) for _ in range(20))
+        flat = min(_time(engine.predict, X) for _ in range(20))
+        print(f"{name}: {engine.n_trees} trees, depth {engine.depth}, {engine.nbytes / 1024:.0f} KB flat; "
+              f"single-row predict {ref * 1e3:.2f} ms -> {flat * 1e3:.3f} ms ({ref / flat:.0f}x), "
+              f"used up to {engine.max_rows} rows", file=sys.stderr)
+
+
+def _time(fn, X):
+    t0 = time.perf_counter(); fn(X); return time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    main()
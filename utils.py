@@ -1,20 +1,8 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
 import os
-import joblib
-
-# Try to import sklearn components
-try:
-    from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor, AdaBoostRegressor, ExtraTreesRegressor
-    from sklearn.linear_model import LinearRegression, Ridge, Lasso, ElasticNet
-    from sklearn.tree import DecisionTreeRegressor
-    from sklearn.neighbors import KNeighborsRegressor
-    from sklearn.svm import SVR
-    from sklearn.preprocessing import StandardScaler
-    HAS_SKLEARN = True
-except ImportError:
-    HAS_SKLEARN = False
+from metrics import METRICS, span
+# Everything else (pandas, pyarrow, scikit-learn, the model registry) is imported
+# inside the functions that need it: Home and the navigation bar only need streamlit.
 
 # ==========================================
 # 1. CSS
@@ -78,80 +66,169 @@ def navigation():
 # ==========================================
 # 3. LIVE ENGINE (Shared Logic)
 # ==========================================
-@st.cache_resource
+_REGISTRY = None
+
+def get_registry():
+    # One model registry per process, created on first use
+    global _REGISTRY
+    if _REGISTRY is None:
+        from registry import ModelRegistry
+        _REGISTRY = ModelRegistry()
+    return _REGISTRY
+
+def __getattr__(name):
+    # Lazily resolved module attributes, so `from utils import MODEL_CHOICES` etc. keep working
+    if name == 'REGISTRY': return get_registry()
+    if name == 'MODEL_CHOICES':
+        from training import model_types
+        return model_types()
+    if name in ('is_servable', 'serves_profiles', 'predict_batch'):
+        import registry
+        return getattr(registry, name)
+    raise AttributeError(f"module 'utils' has no attribute {name!r}")
+
 def get_live_model(model_type="Random Forest"):
-    if not os.path.exists('medical_insurance.csv'): return None, "CSV Missing"
-    df = pd.read_csv('medical_insurance.csv')
-    
-    # Sampling for speed
-    if len(df) > 5000: df = df.sample(5000, random_state=42)
-    
-    # Clean
-    df['income'] = df['income'].fillna(df['income'].median())
-    
-    dep_col = 'children' if 'children' in df.columns else 'dependents'
-    if dep_col not in df.columns: df['dependents'] = 0; dep_col = 'dependents'
-    
-    features_raw = ['age', 'bmi', 'sex', 'smoker', 'region', dep_col]
-    target = 'annual_medical_cost'
-    
-    df = df[features_raw + [target]].dropna()
-    
-    # Encoding
-    df['sex_code'] = df['sex'].map({'Male': 1, 'Female': 0}).fillna(0)
-    df['smoker_code'] = df['smoker'].map({'Current': 2, 'Former': 1, 'Never': 0}).fillna(0)
-    regions = ['North', 'South', 'East', 'West']
-    for r in regions: df[f'region_{r}'] = (df['region'] == r).astype(int)
-        
-    feature_cols = ['age', 'bmi', 'sex_code', 'smoker_code', dep_col] + [f'region_{r}' for r in regions]
-    X = df[feature_cols]
-    y = df[target]
-    
-    if HAS_SKLEARN:
-        if model_type == "Random Forest": model = RandomForestRegressor(n_estimators=50, max_depth=10, random_state=42)
-        elif model_type == "Gradient Boosting": model = GradientBoostingRegressor(n_estimators=100, max_depth=3, random_state=42)
-        elif model_type == "Linear Regression": model = LinearRegression()
-        elif model_type == "Decision Tree": model = DecisionTreeRegressor(max_depth=10)
-        elif model_type == "Ridge Regression": model = Ridge()
-        elif model_type == "Lasso Regression": model = Lasso()
-        elif model_type == "K-Nearest Neighbors":
-            scaler = StandardScaler(); X = scaler.fit_transform(X)
-            model = KNeighborsRegressor(n_neighbors=5); model.custom_scaler = scaler
-        elif model_type == "Support Vector Machine (SVR)":
-            scaler = StandardScaler(); X = scaler.fit_transform(X)
-            model = SVR(); model.custom_scaler = scaler
-        else: model = RandomForestRegressor(n_estimators=50)
-            
-        model.fit(X, y)
-        return model, feature_cols
-    return None, "No Sklearn"
-
-def predict_live(model, features, inputs):
-    input_data = pd.DataFrame(0, index=[0], columns=features)
-    input_data['age'] = inputs['age']
-    input_data['bmi'] = inputs['bmi']
-    input_data[features[4]] = inputs.get('dependents', 0)
-    input_data['sex_code'] = 1 if inputs['sex'] == 'Male' else 0
-    input_data['smoker_code'] = 2 if inputs['smoker'] else 0
-    reg = inputs.get('region', 'North')
-    if f'region_{reg}' in input_data.columns: input_data[f'region_{reg}'] = 1
-        
-    if hasattr(model, 'custom_scaler'): return model.predict(model.custom_scaler.transform(input_data))[0]
-    return model.predict(input_data)[0]
-
-@st.cache_data
-def load_dataset():
-    if os.path.exists('medical_insurance.csv'):
-        df = pd.read_csv('medical_insurance.csv')
-        if 'income' not in df.columns: df['income'] = 50000
-    else:
+    # Keyed on the registry version: an incremental update reloads only that model
+    METRICS.cache_request('live_model')
+    return _get_live_model(model_type, get_registry().version(model_type))
+
+@st.cache_resource(max_entries=32)
+def _get_live_model(model_type, version):
+    from registry import serves_profiles
+    from datastore import SOURCE_CSV
+    from training import HAS_SKLEARN, train_model
+    METRICS.cache_miss('live_model')
+    # Persisted artifact first; train live only when none fits
+    reg = get_registry()
+    with span('model_load'): hit = reg.load(model_type, servable=serves_profiles)
+    if hit: return hit
+    if not os.path.exists(SOURCE_CSV): return None, "CSV Missing"
+    if not HAS_SKLEARN: return None, "No Sklearn"
+    # As many rows as fit in training.TRAIN_BUDGET_S (all of them for streamed linear models)
+    with span('train'):
+        model = train_model(model_type)
+        features = model.feature_encoder.features
+        reg.save(model_type, model, features)
+    return model, features
+
+def predict_live(model, features, inputs, level=None):
+    # One profile -> its estimate, or (estimate, lower, upper) with an interval `level`
+    from registry import predict_batch
+    with span('inference'):
+        out = predict_batch(model, features, inputs, level=level)
+        return out[0] if level is None else tuple(float(v[0]) for v in out)
+
+# Pre-score the common profile grid when a model version is first used
+PREWARM_PREDICTIONS = os.environ.get('PREWARM_PREDICTIONS', '0') == '1'
+INTERVAL_LEVEL = float(os.environ.get('INTERVAL_LEVEL', 0.9))  # Must be one of intervals.LEVELS
+
+@st.cache_resource
+def prediction_cache():
+    # One LRU/TTL cache per process, shared by every session
+    from prediction_cache import PredictionCache
+    cache = PredictionCache()
+    for stat in ('hits', 'misses', 'evictions', 'entries'):
+        METRICS.gauge(f'prediction_cache_{stat}', lambda stat=stat: cache.stats()[stat])
+    return cache
+
+def predict_profiles(model_type, model, features, profiles):
+    import numpy as np
+    from registry import predict_batch
+    from prediction_cache import cached_predict, warm
+    # Repeat profiles (same model version) skip inference; misses go out in one batch.
+    # Rows are (estimate, lower, upper): the interval comes out of the same predict call
+    cache = prediction_cache()
+    key = (model_type, get_registry().version(model_type), INTERVAL_LEVEL)
+    predict = lambda frame: np.column_stack(predict_batch(model, features, frame, level=INTERVAL_LEVEL))
+    if PREWARM_PREDICTIONS: warm(cache, key, predict)
+    with span('inference'): return cached_predict(cache, key, profiles, predict)
+
+def load_sensitivity(model_type, model, features, inputs):
+    from prediction_cache import canonical
+    # Keyed on model version + the quantized profile: a widget change elsewhere on the page reuses the grid
+    METRICS.cache_request('sensitivity')
+    return _load_sensitivity(model_type, get_registry().version(model_type), canonical(inputs), model, features, inputs)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _load_sensitivity(model_type, version, profile, _model, features, _inputs):
+    from registry import predict_batch
+    from scenarios import sweep
+    METRICS.cache_miss('sensitivity')
+    # BMI x smoking x aging x dependents grid (~7.8k rows), scored in one batched call
+    with span('sensitivity'): return sweep(lambda cols: predict_batch(_model, features, cols), _inputs)
+
+def load_dataset(columns=None):
+    from datastore import data_version
+    # One read-only frame per process and data version, shared by all sessions
+    # (zero-copy over the memory-mapped Arrow store). Pages must not add or
+    # overwrite columns on it.
+    METRICS.cache_request('dataset')
+    return _load_dataset(tuple(columns) if columns is not None else None, data_version())
+
+@st.cache_resource(max_entries=16)
+def _load_dataset(columns, version):
+    import pandas as pd
+    from datastore import read_table, add_derived
+    METRICS.cache_miss('dataset')
+    with span('data_load'): df = read_table(list(columns) if columns is not None else None)
+    if df is None:
         # Dummy
-        df = pd.DataFrame({'age': [30], 'annual_medical_cost': [5000]})
-    
-    # Feature Engineering for Dashboard Analysis
-    if 'risk_score' not in df.columns:
-        df['risk_score'] = (df['age'] * 0.4) + (df['bmi'] * 0.6)
-    if 'risk_category' not in df.columns:
-        try: df['risk_category'] = pd.qcut(df['risk_score'], q=[0, .33, .66, 1], labels=['Low', 'Medium', 'High'])
-        except: df['risk_category'] = 'Medium'
-    return df
\ No newline at end of file
+        df = add_derived(pd.DataFrame({'age': [30], 'bmi': [25.0], 'annual_medical_cost': [5000]}))
+    return df
+
+def load_aggregates():
+    from datastore import data_version
+    METRICS.cache_request('aggregates')
+    return _load_aggregates(data_version())
+
+@st.cache_resource(max_entries=2)
+def _load_aggregates(version):
+    from datastore import RISK_LABELS
+    from aggregates import Cube, load_cube
+    METRICS.cache_miss('aggregates')
+    # Pre-aggregated region x risk cube: dashboard widgets read cells, not rows
+    with span('data_load'): return load_cube() or Cube.empty([], RISK_LABELS, [])
+
+def load_chart_sample(n=2000, region=None, risk=None):
+    from datastore import data_version
+    METRICS.cache_request('chart_sample')
+    return _load_chart_sample(n, region, risk, data_version())
+
+@st.cache_data(max_entries=64)
+def _load_chart_sample(n, region, risk, version):
+    # Seeded, stratified rows kept in the cube: a filter always plots the same points,
+    # and the payload stays n compact rows however large the population grows
+    METRICS.cache_miss('chart_sample')
+    cube = load_aggregates()
+    with span('chart_sample'): return cube.sample(n, region, risk)
+
+def load_attributions(model_type, model, features):
+    from datastore import data_version
+    # Keyed on model + data version: reruns are instant, an update recomputes
+    METRICS.cache_request('attributions')
+    return _load_attributions(model_type, get_registry().version(model_type), data_version(), model, features)
+
+@st.cache_data(max_entries=16, show_spinner="Computing attributions...")
+def _load_attributions(model_type, version, data_ver, _model, features):
+    from explain import explain, EXPLAIN_ROWS, BACKGROUND_ROWS
+    from training import load_training_data
+    METRICS.cache_miss('attributions')
+    with span('data_load'): hit = load_training_data(sample=EXPLAIN_ROWS + BACKGROUND_ROWS)
+    if hit is None: return None
+    encoder, X, _ = hit
+    if encoder.features != list(features): return None
+    # The first rows are explained, the rest are the reference population
+    with span('explain'): return explain(_model, X[:EXPLAIN_ROWS], features, background=X[EXPLAIN_ROWS:])
+
+def load_leaderboard():
+    from training import LEADERBOARD
+    mtime = os.path.getmtime(LEADERBOARD) if os.path.exists(LEADERBOARD) else None
+    METRICS.cache_request('leaderboard')
+    return _load_leaderboard(mtime)
+
+@st.cache_data(max_entries=2)
+def _load_leaderboard(mtime):
+    from training import read_leaderboard
+    METRICS.cache_miss('leaderboard')
+    # Written by `python -m training`; None until the catalog has been benchmarked
+    with span('data_load'): return read_leaderboard() if mtime else None